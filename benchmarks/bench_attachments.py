@@ -0,0 +1,77 @@
+"""Attachment link rewriting: per-id compile and rescan (before) against a single re.sub pass (now).
+
+Run from the repository root:
+
+    python benchmarks/bench_attachments.py > bench_output.txt
+"""
+import os
+import re
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.entities.attachments import Attachments, ATTACHMENT_PATTERN  # noqa: E402
+from src.support import Mappings  # noqa: E402
+
+OLD_PATTERN = r'!\[\]\(index\.php\?/attachments/get/([a-f0-9-]+)\)'
+
+
+class NullLogger:
+    def log(self, message, level='info'):
+        pass
+
+
+def old_replace(string: str, attachments_map: dict) -> str:
+    # Previous implementation: findall to detect links, then one re.sub with a freshly built pattern per id
+    if not re.findall(r'index\.php\?/attachments/get/([a-f0-9-]+)', string):
+        return string
+    string = re.sub(r'^E_', '', string)
+    for match in re.finditer(OLD_PATTERN, string):
+        attachment_id = match.group(1)
+        string = re.sub(
+            f'!\\[\\]\\(index\\.php\\?/attachments/get/{attachment_id}\\)',
+            f'![{attachments_map[attachment_id]["filename"]}]({attachments_map[attachment_id]["url"]})',
+            string
+        )
+    return string
+
+
+def make_attachments(links: int, text_size: int):
+    mappings = Mappings()
+    ids = [str(uuid.uuid4()) for _ in range(links)]
+    for attachment_id in ids:
+        mappings.attachments_map[attachment_id] = {
+            'hash': attachment_id.replace('-', ''),
+            'filename': f'{attachment_id[:8]}.png',
+            'url': f'https://qase.io/attachment/{attachment_id}.png',
+        }
+    filler = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * (text_size // 57 + 1)
+    parts = [filler[:text_size]]
+    for attachment_id in ids:
+        parts.append(f'![](index.php?/attachments/get/{attachment_id})')
+        parts.append(filler[:200])
+    attachments = Attachments.__new__(Attachments)
+    attachments.mappings = mappings
+    attachments.logger = NullLogger()
+    attachments.pattern = ATTACHMENT_PATTERN
+    return attachments, '\n'.join(parts)
+
+
+def main(number: int = 2000):
+    print(f'{"links":>6} {"text":>7} {"before, us":>11} {"now, us":>9} {"speedup":>8}')
+    for links, text_size in ((0, 2000), (1, 2000), (10, 5000), (50, 20000), (200, 50000)):
+        attachments, string = make_attachments(links, text_size)
+        assert old_replace(string, attachments.mappings.attachments_map) == attachments.replace_attachments(string, 'PRJ')
+
+        # Same checks as check_and_replace_attachments, without the upload of missing attachments
+        new = lambda: attachments.replace_attachments(string, 'PRJ') if 'index.php?/attachments/get/' in string else string
+        runs = max(10, number // max(1, links))
+        before = timeit.timeit(lambda: old_replace(string, attachments.mappings.attachments_map), number=runs) / runs
+        now = timeit.timeit(new, number=runs) / runs
+        print(f'{links:>6} {len(string):>7} {before * 1e6:>11.1f} {now * 1e6:>9.1f} {before / now:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
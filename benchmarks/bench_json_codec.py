@@ -0,0 +1,89 @@
+"""JSON codec on real-sized TestRail pages: the standard json module against the backend picked by json_codec.
+
+Run from the repository root:
+
+    python benchmarks/bench_json_codec.py >> bench_output.txt
+"""
+import json
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.support import json_codec  # noqa: E402
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def text(size: int) -> str:
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 10))) for _ in range(size // 6)]
+    return ' '.join(words)[:size] + ' ![](index.php?/attachments/get/5d1c2a6e-0b7f-4d4e-9c1b-1f0e2d3c4b5a) ünïcødé'
+
+
+def case(case_id: int) -> dict:
+    # Same shape as a get_cases entry, with the step and description fields of a long manual case
+    return {
+        'id': case_id,
+        'title': text(120),
+        'section_id': random.randint(1, 500),
+        'template_id': 2,
+        'type_id': 7,
+        'priority_id': 2,
+        'milestone_id': None,
+        'refs': 'JIRA-1234, JIRA-5678',
+        'created_by': 1,
+        'created_on': 1700000000 + case_id,
+        'updated_by': 1,
+        'updated_on': 1700000000 + case_id,
+        'estimate': None,
+        'suite_id': 1,
+        'display_order': case_id,
+        'is_deleted': 0,
+        'custom_automation_type': 0,
+        'custom_preconds': text(2000),
+        'custom_description': text(4000),
+        'custom_steps_separated': [
+            {'content': text(500), 'expected': text(500), 'additional_info': '', 'refs': ''}
+            for _ in range(8)
+        ],
+        'custom_tags': [1, 2, 3],
+    }
+
+
+def page(size: int = 250) -> dict:
+    return {
+        'offset': 0,
+        'limit': size,
+        'size': size,
+        '_links': {'next': f'/api/v2/get_cases/1&limit={size}&offset={size}', 'prev': None},
+        'cases': [case(i) for i in range(1, size + 1)],
+    }
+
+
+def main(number: int = 20):
+    random.seed(1)
+    data = page()
+    payload = json.dumps(data).encode('utf-8')
+
+    codecs = {'json': (lambda obj: json.dumps(obj).encode('utf-8'), json.loads)}
+    if ujson is not None:
+        codecs['ujson'] = (lambda obj: ujson.dumps(obj, ensure_ascii=False).encode('utf-8'), ujson.loads)
+    codecs[f'json_codec ({json_codec.name})'] = (json_codec.dumpb, json_codec.loads)
+
+    print(f'Page of {len(data["cases"])} cases, {len(payload) / 1024 / 1024:.1f} Mb')
+    print(f'{"codec":>22} {"decode, ms":>11} {"encode, ms":>11}')
+    for name, (dumpb, loads) in codecs.items():
+        assert loads(payload) == data
+        decode = timeit.timeit(lambda: loads(payload), number=number) / number
+        encode = timeit.timeit(lambda: dumpb(data), number=number) / number
+        print(f'{name:>22} {decode * 1e3:>11.2f} {encode * 1e3:>11.2f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -1,14 +1,32 @@
-from .support import ConfigManager, Logger, Mappings, ThrottledThreadPoolExecutor, Pools
+from .support import ConfigManager, Logger, Mappings, Stats, ThrottledThreadPoolExecutor, Pools, AdaptiveRate, TokenBucket, SqliteTokenBucket
 from .service import QaseService, TestrailService, QaseScimService
 from .entities import Users, Fields, Projects, Suites, Cases, Runs, Milestones, Configurations, Attachments, SharedSteps
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import asyncio
+import os
 
 
 class TestRailImporter:
     def __init__(self, config: ConfigManager, logger: Logger) -> None:
+        qase_requests = config.get('qase.rate.requests') or 250
+        qase_interval = config.get('qase.rate.interval') or 12
+        # Ceiling of the Qase rate, the configured rate unless the adaptive rate may go above it
+        qase_max_rate = qase_requests / qase_interval
+        if config.get('qase.rate.adaptive'):
+            qase_max_rate = config.get('qase.rate.max') or 2 * qase_max_rate
         self.pools = Pools(
-            qase_pool=ThrottledThreadPoolExecutor(max_workers=8, requests=250, interval=12),
+            qase_pool=ThrottledThreadPoolExecutor(
+                max_workers=8,
+                requests=qase_requests,
+                interval=qase_interval,
+                budgets=self._get_budgets(config),
+                bucket=self._get_shared_bucket(config, 'qase', qase_requests / qase_interval, qase_max_rate),
+            ),
             tr_pool=ThreadPoolExecutor(max_workers=8),
+            large_pool=ThreadPoolExecutor(max_workers=config.get('attachments.large_workers') or 2),
+            read_ahead=config.get('read_ahead') or 2,
+            window=config.get('window') or 2,
         )
 
         self.logger = logger
@@ -16,18 +34,61 @@ class TestRailImporter:
         self.qase_scim_service = None
         
         self.qase_service = QaseService(config, logger)
+        self.qase_service.pool = self.pools.qase_pool
+        if config.get('qase.rate.adaptive'):
+            self.qase_service.limiter = AdaptiveRate(
+                self.pools.qase_pool.bucket,
+                logger,
+                min_rate=config.get('qase.rate.min') or 1,
+                max_rate=qase_max_rate,
+            )
         if config.get('qase.scim_token'):
             self.qase_scim_service = QaseScimService(config, logger)
 
-        self.testrail_service = TestrailService(config, logger)
+        self.testrail_service = TestrailService(
+            config,
+            logger,
+            workers=self.pools.tr_pool._max_workers + self.pools.large_pool._max_workers,
+        )
 
         self.active_project_code = None
 
         self.mappings = Mappings(self.config.get('users.default'))
+        # Latest Qase pool and limiter stats of each worker process, by process id
+        self.workers = {}
+
+    # Rate budgets of Qase operation families (attachments, cases, results, runs, metadata) on top of the global rate
+    @classmethod
+    def _get_budgets(cls, config: ConfigManager) -> dict:
+        budgets = {}
+        for name, budget in (config.get('qase.rate.budgets') or {}).items():
+            rate = budget['requests'] / (budget.get('interval') or 1)
+            budgets[name] = cls._get_shared_bucket(config, f'qase.{name}', rate) or TokenBucket(rate)
+        return budgets
+
+    # With qase.rate.shared, rate buckets live in a SQLite file shared by all migrator processes on the host.
+    # Projects imported in worker processes always share one, by default in the cache directory
+    @staticmethod
+    def _get_shared_bucket(config: ConfigManager, name: str, rate: float, max_rate: float = None):
+        path = config.get('qase.rate.shared')
+        if not path and (config.get('projects.processes') or 1) > 1:
+            path = os.path.join('./cache', str(config.get('prefix') or 'default'), 'qase_rate.sqlite')
+        if not path:
+            return None
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # The main process of a run with worker processes sets the configured rate, workers keep the adjusted one
+        reset = (config.get('projects.processes') or 1) > 1 and multiprocessing.parent_process() is None
+        return SqliteTokenBucket(path, name, rate, reset=reset, max_rate=max_rate or rate)
 
     def start(self):
+        asyncio.run(self.start_async())
+
+    # The whole migration runs as one task tree on a single event loop
+    async def start_async(self):
         # Step 1. Build users map
-        self.mappings = Users(
+        self.mappings = await Users(
             self.qase_service,
             self.testrail_service,
             self.logger,
@@ -35,103 +96,188 @@ class TestRailImporter:
             self.config,
             self.pools,
             self.qase_scim_service,
-        ).import_users()
+        ).import_users_async()
 
         # Step 2. Import project and build projects map
-        self.mappings = Projects(
+        self.mappings = await Projects(
             self.qase_service, 
             self.testrail_service, 
             self.logger, 
             self.mappings,
             self.config,
             self.pools,
-        ).import_projects()
+        ).import_projects_async()
 
         # Step 3. Import attachments
-        self.mappings = Attachments(
+        self.mappings = await Attachments(
             self.qase_service,
             self.testrail_service,
             self.logger,
             self.mappings,
             self.config,
             self.pools,
-        ).import_all_attachments()
+        ).import_all_attachments_async()
 
         # Step 4. Import custom fields
-        self.mappings = Fields(
+        self.mappings = await Fields(
             self.qase_service, 
             self.testrail_service, 
             self.logger, 
             self.mappings,
             self.config,
             self.pools,
-        ).import_fields()
+        ).import_fields_async()
+
+        # Step 5. Import projects data concurrently, in this process or in worker processes
+        processes = self.config.get('projects.processes') or 1
+        if processes > 1:
+            await self.import_projects_in_processes(processes)
+        else:
+            await self.import_projects_in_loop()
 
-        # Step 5. Import projects data in parallel
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            futures = []
-            for project in self.mappings.projects:
-                # Submit each project import to the thread pool
-                future = executor.submit(self.import_project_data, project)
-                futures.append(future)
+        if self.mappings.attachments_cache is not None:
+            self.mappings.attachments_cache.close()
 
-            # Wait for all futures to complete
-            for future in futures:
-                # This will also re-raise any exceptions caught during execution of the callable
-                future.result()
+        if self.testrail_service.aio:
+            self.testrail_service.aio.close()
+
+        # Most Qase calls of a run with worker processes are made by the workers
+        pool_stats = ThrottledThreadPoolExecutor.merge_stats(
+            [self.pools.qase_pool.stats()] + [worker['pool'] for worker in self.workers.values()]
+        )
+        if self.qase_service.limiter:
+            pool_stats.update(AdaptiveRate.merge_stats(
+                [self.qase_service.limiter.stats()] + [worker['limiter'] for worker in self.workers.values() if worker['limiter']]
+            ))
+        self.mappings.stats.add_pool('qase', pool_stats)
+        self.mappings.stats.add_http('testrail', self._sum_stats(
+            [self.testrail_service.get_connection_stats()] + [worker['testrail'] for worker in self.workers.values()]
+        ))
+        if self.testrail_service.cache:
+            self.mappings.stats.add_http('testrail_cache', self._sum_stats(
+                [self.testrail_service.get_cache_stats()] + [worker['testrail_cache'] for worker in self.workers.values()]
+            ))
+        if self.qase_scim_service:
+            self.mappings.stats.add_http('qase_scim', self.qase_scim_service.get_connection_stats())
 
         self.mappings.stats.print()
         self.mappings.stats.save(str(self.config.get('prefix')))
         self.mappings.stats.save_xlsx(str(self.config.get('prefix')))
 
+    async def import_projects_in_loop(self):
+        parallel = asyncio.Semaphore(self.config.get('projects.parallel') or 8)
+
+        async def import_project(project):
+            async with parallel:
+                await self.import_project_data_async(project)
+
+        # A failed project does not stop the others half way, they finish before the failures are raised
+        results = await asyncio.gather(*(import_project(project) for project in self.mappings.projects), return_exceptions=True)
+        self._raise_failures(results)
+
+    def _raise_failures(self, results: list):
+        failures = []
+        for project, result in zip(self.mappings.projects, results):
+            if isinstance(result, Exception):
+                self.logger.log(f'[{project["code"]}] Failed to import project data: {result}', 'error')
+                failures.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+        if failures:
+            raise ExceptionGroup(f'Failed to import {len(failures)} of {len(results)} projects', failures)
+
+    # Projects are imported by worker processes, so preparation of cases and results runs on several cores.
+    # Workers receive the global mappings once and send back the stats and new attachments of each project
+    async def import_projects_in_processes(self, processes: int):
+        self.logger.log(f'Importing projects in {processes} processes')
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.config, self.logger, self.mappings),
+        ) as executor:
+            results = await asyncio.gather(
+                *(loop.run_in_executor(executor, _import_project, project) for project in self.mappings.projects),
+                return_exceptions=True,
+            )
+        for result in results:
+            if not isinstance(result, BaseException):
+                self._merge_project(result)
+        self._raise_failures(results)
+
+    def _merge_project(self, result: dict):
+        # Workers only know their own references, the parent counts each id once
+        refs = result['attachments_refs'] - self.mappings.attachments_refs
+        result['stats'].attachments['referenced'] = len(refs)
+        self.mappings.stats.merge(result['stats'])
+        self.mappings.attachments_map.update(result['attachments_map'])
+        self.mappings.attachments_refs.update(refs)
+        for code, digests in result['attachments_digests'].items():
+            self.mappings.attachments_digests.setdefault(code, {}).update(digests)
+        self.workers[result['worker']['pid']] = result['worker']
+
+    # Adds up counters of the parent and the workers, other values (e.g. the cache mode) are the same in all
+    @staticmethod
+    def _sum_stats(stats: list) -> dict:
+        total = {}
+        for item in stats:
+            if item:
+                total = Stats._merge(total, dict(item))
+        return total
+
     def import_project_data(self, project):
+        asyncio.run(self.import_project_data_async(project))
+
+    async def import_project_data_async(self, project):
         self.logger.print_group(f'Importing project: {project["name"]}'
                                 + (' ('
                                    + project['suite_title']
                                    + ')' if 'suite_title' in project else ''))
 
-        self.mappings = Configurations(
+        self.mappings = await Configurations(
             self.qase_service,
             self.testrail_service,
             self.logger,
             self.mappings,
             self.pools,
-        ).import_configurations(project)
+        ).import_configurations_async(project)
 
-        self.mappings = SharedSteps(
+        self.mappings = await SharedSteps(
             self.qase_service,
             self.testrail_service,
             self.logger,
             self.mappings,
             self.pools,
-        ).import_shared_steps(project)
+        ).import_shared_steps_async(project)
 
-        self.mappings = Milestones(
+        self.mappings = await Milestones(
             self.qase_service,
             self.testrail_service,
             self.logger,
             self.mappings,
-        ).import_milestones(project)
+            self.pools,
+        ).import_milestones_async(project)
 
-        self.mappings = Suites(
+        self.mappings = await Suites(
             self.qase_service,
             self.testrail_service,
             self.logger,
             self.mappings,
             self.config,
             self.pools,
-        ).import_suites(project)
+        ).import_suites_async(project)
 
-        Cases(
+        await Cases(
             self.qase_service,
             self.testrail_service,
             self.logger,
             self.mappings,
             self.config,
             self.pools,
-        ).import_cases(project)
+        ).import_cases_async(project)
 
-        Runs(
+        await Runs(
             self.qase_service,
             self.testrail_service,
             self.logger,
@@ -139,4 +285,43 @@ class TestRailImporter:
             self.config,
             project,
             self.pools,
-        ).import_runs()
+        ).import_runs_async()
+
+
+# Importer of a worker process, with its own services and pools and the global mappings of the parent
+_worker = None
+
+
+def _init_worker(config: ConfigManager, logger: Logger, mappings: Mappings):
+    global _worker
+    _worker = TestRailImporter(config, logger)
+    _worker.mappings = mappings
+
+
+def _import_project(project) -> dict:
+    mappings = _worker.mappings
+    known = set(mappings.attachments_map)
+    refs = set(mappings.attachments_refs)
+    # Stats of this project only, the parent adds them to its own
+    titles = mappings.stats.projects
+    mappings.stats = Stats()
+    mappings.stats.add_project(project['code'], titles[project['code']]['title'])
+    try:
+        asyncio.run(_worker.import_project_data_async(project))
+    finally:
+        stats, mappings.stats = mappings.stats, Stats()
+        mappings.stats.projects = titles
+    return {
+        'stats': stats,
+        'attachments_map': {key: value for key, value in mappings.attachments_map.items() if key not in known},
+        'attachments_refs': mappings.attachments_refs - refs,
+        'attachments_digests': {project['code']: mappings.attachments_digests.get(project['code'], {})},
+        # Totals of the worker so far, the parent keeps the latest ones
+        'worker': {
+            'pid': os.getpid(),
+            'pool': _worker.pools.qase_pool.stats(),
+            'limiter': _worker.qase_service.limiter.stats() if _worker.qase_service.limiter else None,
+            'testrail': _worker.testrail_service.get_connection_stats(),
+            'testrail_cache': _worker.testrail_service.get_cache_stats(),
+        },
+    }
@@ -1,7 +1,11 @@
 from .testrail import TestrailApiClient
 from .qase_scim import QaseScimClient
+from .session import PooledSession
+from .testrail_async import TestrailAsyncApiClient
 
 __all__ = [
     'TestrailApiClient',
-    "QaseScimClient"
+    "QaseScimClient",
+    "PooledSession",
+    "TestrailAsyncApiClient",
 ]
\ No newline at end of file
@@ -1,9 +1,12 @@
 import time
-import requests
-import json
+from urllib.parse import urlparse
+
+from .session import PooledSession
+from ..support import json_codec
+from ..support import RetryPolicy
 
 class QaseScimClient:
-    def __init__(self, base_url, token, max_retries=3, backoff_factor=1, ssl=True):
+    def __init__(self, base_url, token, max_retries=3, backoff_factor=1, ssl=True, pool_size=10):
         if not base_url.endswith('/'):
             base_url += '/'
         if ssl:
@@ -17,33 +20,40 @@ class QaseScimClient:
         }
         self.max_retries = max_retries
         self.backoff_factor = backoff_factor
+        self.retry = RetryPolicy(max_retries=max_retries, base=backoff_factor)
+        self.breaker = self.retry.breaker(urlparse(self.__url).netloc)
+        self.session = PooledSession(pool_size)
 
     def get(self, uri):
-        return self.send_request(requests.get, uri)
+        return self.send_request(self.session.get, uri)
     
     def post(self, uri, payload):
-        return self.send_request(requests.post, uri, payload)
+        return self.send_request(self.session.post, uri, payload)
     
     def put(self, uri, payload):
-        return self.send_request(requests.put, uri, payload)
+        return self.send_request(self.session.put, uri, payload)
     
     def patch(self, uri, payload):
-        return self.send_request(requests.patch, uri, payload)
+        return self.send_request(self.session.patch, uri, payload)
 
     def send_request(self, request_method, uri, payload=None):
         url = self.__url + uri
+        json_payload = json_codec.dumpb(payload) if payload is not None else None
+        delay = 0
         for attempt in range(self.max_retries + 1):
-            json_payload = json.dumps(payload) if payload is not None else None
+            self.breaker.wait()
             response = request_method(url, headers=self.headers, data=json_payload)
 
             if response.status_code != 429 and response.status_code <= 201:
+                self.breaker.success()
                 return self.process_response(response, uri)
             elif response.status_code == 500:
                 break
             elif attempt == self.max_retries:
                 break
             else:
-                time.sleep(self.backoff_factor * (2 ** attempt))
+                delay = self.retry.backoff(self.breaker, delay, response.headers.get('Retry-After'))
+                time.sleep(delay)
 
         raise APIError('Max retries reached or server error.')
     
@@ -90,9 +100,12 @@ class QaseScimClient:
         }
         return self.patch(f'Groups/{group_id}', payload)
 
+    def connection_stats(self) -> dict:
+        return self.session.stats()
+
     def process_response(self, response, uri):
         try:
-            return response.json()
+            return json_codec.loads(response.content)
         except:
             raise APIError('Failed to parse JSON response')
 
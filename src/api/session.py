@@ -0,0 +1,63 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PooledSession(requests.Session):
+    # Session shared by all workers of a client. Only the request and connection counters are locked here,
+    # concurrent requests rely on the urllib3 connection pool, so the session must not be reconfigured
+    # (headers, cookies, adapters) while workers use it. Connections are kept alive and reused
+    # from a pool of pool_size connections per host, responses are requested compressed (gzip/deflate).
+    def __init__(self, pool_size: int = 10):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+        adapter = _CountingAdapter(self, pool_connections=4, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections': self.connections,
+                'reused': max(0, self.requests - self.connections),
+            }
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, session: PooledSession, **kwargs):
+        self._session = session
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self._session),
+            'https': _counting_pool(HTTPSConnectionPool, self._session),
+        }
+
+    def send(self, request, *args, **kwargs):
+        self._session.count('requests')
+        return super().send(request, *args, **kwargs)
+
+
+def _counting_pool(base, session: PooledSession):
+    class CountingConnectionPool(base):
+        def _new_conn(self):
+            session.count('connections')
+            return super()._new_conn()
+
+    return CountingConnectionPool
@@ -1,14 +1,19 @@
 import base64
 import time
+from urllib.parse import urlparse
 import requests
 import re
 import http.client
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 
+from .session import PooledSession
+from ..support import json_codec
+from ..support import RetryPolicy, ResponseCache
+
 
 class TestrailApiClient:
-    def __init__(self, base_url, user, token, logger, max_retries=7, backoff_factor=5):
+    def __init__(self, base_url, user, token, logger, max_retries=7, backoff_factor=5, attachments_page_size=250, attachments_workers=24, pool_size=None, cache: ResponseCache = None):
         if not base_url.endswith('/'):
             base_url += '/'
         self.__url = base_url + 'index.php?/api/v2/'
@@ -29,10 +34,18 @@ class TestrailApiClient:
         }
         self.max_retries = max_retries
         self.backoff_factor = backoff_factor
-        self.page_size = 30
-
-        # Create a session object
-        self.session = requests.Session()
+        self.retry = RetryPolicy(max_retries=max_retries, base=backoff_factor)
+        self.breaker = self.retry.breaker(urlparse(base_url).netloc)
+        self.attachments_page_size = attachments_page_size
+        self.attachments_workers = attachments_workers
+        self.cache = cache
+
+        # API requests from all workers share one pool of keep-alive connections
+        pool_size = pool_size or attachments_workers
+        self.http = PooledSession(pool_size)
+
+        # Create a session object. It keeps the auth cookie used to download attachments
+        self.session = PooledSession(pool_size)
         headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Content-Type': 'application/x-www-form-urlencoded',
@@ -52,90 +65,125 @@ class TestrailApiClient:
             self.session = None
 
     def get(self, uri):
-        return self.send_request(requests.get, uri)
+        if self.cache is None:
+            return self.send_request(self.http.get, uri)
+
+        data = self.cache.load(uri)
+        if data is not ResponseCache.MISS:
+            return data
+        if self.cache.mode == 'replay' and self.cache.cacheable(uri):
+            raise APIError(f'Response is not recorded: {uri}')
+        data = self.send_request(self.http.get, uri)
+        self.cache.store(uri, data)
+        return data
+
+    def connection_stats(self) -> dict:
+        stats = self.http.stats()
+        if self.session:
+            for key, value in self.session.stats().items():
+                stats[key] += value
+        return stats
 
     def send_request(self, request_method, uri, payload=None):
         url = self.__url + uri
+        delay = 0
         for attempt in range(self.max_retries + 1):
+            self.breaker.wait()
             try:
                 response = request_method(url, headers=self.headers, data=payload)
                 if response.status_code != 429 and response.status_code <= 201:
+                    self.breaker.success()
                     return self.process_response(response, uri)
                 if response.status_code == 403:
                     raise APIError('Access denied.')
                 if response.status_code == 400:
                     raise APIError('Invalid data or entity not found.')
-                else:
-                    time.sleep(self.backoff_factor * (2 ** attempt))
+                delay = self.retry.backoff(self.breaker, delay, response.headers.get('Retry-After'))
             except (requests.exceptions.Timeout, http.client.RemoteDisconnected, ConnectionResetError, requests.exceptions.ConnectionError) as e:
-                time.sleep(self.backoff_factor * (2 ** attempt))
-            
+                delay = self.retry.backoff(self.breaker, delay)
+
             if attempt == self.max_retries:
                 raise APIError('Max retries reached or server error.')
+            time.sleep(delay)
 
     def process_response(self, response, uri):
         try:
-            return response.json()
+            return json_codec.loads(response.content)
         except:
             raise APIError('Failed to parse JSON response')
             
-    def get_attachment(self, id):
+    def get_attachment(self, id, stream=False):
         if not self.session:
             self.logger.log('Failed to login to TestRail API and get auth cookie')
             return self.get(f'get_attachment/{id}')
         else:
-            return self.session.get(self._attachment_url + id)
+            return self.session.get(self._attachment_url + id, stream=stream)
         
-    def fetch_data(self, offset):
+    def fetch_data(self, offset, limit=None):
         data = {
             'offset': offset,
             'order_by': 'created_on',
             'order_dir': 'desc',
             '_token': self.csrf_token
         }
+        if limit:
+            data['limit'] = limit
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
             'X-Requested-With': 'XMLHttpRequest',
         }
         self.logger.log(f'Getting attachments list, offset: {offset}')
-        try:
-            response = self.session.post(self.base_url + 'index.php?/attachments/overview/0', data=data, headers=headers)
-            response_data = response.json()
-            # Extract only the needed fields (id and project_id) from each item
-            return [{"id": item["id"], "project_id": item["project_id"]} for item in response_data['data']]
-        except Exception as e:
-            self.logger.log(f'Failed to get attachments list, offset: {offset}: {e}')
-            return None
+        # A failed page is retried like API requests: one lost page would drop every attachment listed after it
+        delay = 0
+        for attempt in range(self.max_retries + 1):
+            self.breaker.wait()
+            try:
+                response = self.session.post(self.base_url + 'index.php?/attachments/overview/0', data=data, headers=headers)
+                if response.status_code == 429 or response.status_code >= 500:
+                    error = f'status {response.status_code}'
+                    delay = self.retry.backoff(self.breaker, delay, response.headers.get('Retry-After'))
+                else:
+                    response_data = response.json()
+                    self.breaker.success()
+                    # Extract only the needed fields (id, project_id and size when reported) from each item
+                    return [{"id": item["id"], "project_id": item["project_id"], "size": item.get("size")} for item in response_data['data']]
+            except Exception as e:
+                error = e
+                delay = self.retry.backoff(self.breaker, delay)
+
+            self.logger.log(f'Failed to get attachments list, offset: {offset}: {error}', 'warning')
+            if attempt == self.max_retries:
+                self.logger.log(f'Failed to get attachments list, offset: {offset}, giving up', 'error')
+                raise APIError(f'Failed to get attachments list at offset {offset}: {error}')
+            time.sleep(delay)
 
     def get_attachments_list(self):
-        max_workers = 24
-        total_items = 120000
-        attachments = []
-        stop = False
-        next_offset = 0
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(self.fetch_data, offset) for offset in range(0, max_workers * self.page_size, self.page_size)]
-
-            while futures:
-                for future in as_completed(futures):
-                    futures.remove(future)
-                    result = future.result()
-                    if result is None:  # If a future returned None, stop submitting new tasks
-                        stop = True
+        if not self.session:
+            self.logger.log('Failed to login to TestRail, attachments can not be listed', 'error')
+            return []
+        # The first page tells the real page size: the endpoint may cap the requested limit. The endpoint reports
+        # no total that can be trusted, so pages are requested in growing waves until the first short page.
+        # A page that fails after retries fails the listing instead of ending it early
+        attachments = self.fetch_data(0, self.attachments_page_size)
+        if not attachments:
+            return []
+        page_size = len(attachments)
+        self.logger.log(f'Attachments list page size: {page_size}')
+
+        with ThreadPoolExecutor(max_workers=self.attachments_workers) as executor:
+            next_offset = page_size
+            wave = 1
+            while True:
+                offsets = range(next_offset, next_offset + wave * page_size, page_size)
+                pages = executor.map(lambda offset: self.fetch_data(offset, page_size), offsets)
+                for page in pages:
+                    attachments.extend(page)
+                    if len(page) < page_size:
                         self.logger.log('No more attachments to process')
-                    else:
-                        attachments.extend(result)
-                        if not stop:
-                            next_offset += self.page_size
-                            if next_offset < total_items:  # Ensure we do not exceed total_items
-                                futures.append(executor.submit(self.fetch_data, next_offset))
-                            else:
-                                stop = True  # No more offsets to process
-
-        return attachments
-        
-        
+                        return attachments
+                next_offset += wave * page_size
+                wave = min(wave * 2, self.attachments_workers)
+
 
 class APIError(Exception):
     pass
\ No newline at end of file
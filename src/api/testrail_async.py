@@ -0,0 +1,116 @@
+import asyncio
+import base64
+import threading
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .testrail import APIError
+from ..support import json_codec
+from ..support import RetryPolicy, ResponseCache
+
+
+class TestrailAsyncApiClient:
+    # Native asyncio client for TestRail API reads. All requests run on one background event loop,
+    # so callers from any thread or event loop can await them. In-flight requests are bounded by a semaphore.
+    def __init__(self, base_url, user, token, logger, max_retries=7, backoff_factor=5, concurrency=100, cache: ResponseCache = None):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for the async TestRail API client')
+        if not base_url.endswith('/'):
+            base_url += '/'
+        self.__url = base_url + 'index.php?/api/v2/'
+        self.logger = logger
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.concurrency = concurrency
+        self.cache = cache
+        # Shares the breaker with the threaded client, so both back off together
+        self.retry = RetryPolicy(max_retries=max_retries, base=backoff_factor)
+        self.breaker = self.retry.breaker(urlparse(base_url).netloc)
+        auth = str(
+            base64.b64encode(
+                bytes('%s:%s' % (user, token), 'utf-8')
+            ),
+            'ascii'
+        ).strip()
+        self.headers = {
+            'Authorization': 'Basic ' + auth,
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+        }
+
+        self.loop = asyncio.new_event_loop()
+        self._session = None
+        self._semaphore = None
+        self._thread = threading.Thread(target=self.loop.run_forever, name='testrail-aio', daemon=True)
+        self._thread.start()
+
+    async def get(self, uri):
+        future = asyncio.run_coroutine_threadsafe(self._cached_get(uri), self.loop)
+        return await asyncio.wrap_future(future)
+
+    async def _cached_get(self, uri):
+        if self.cache is None:
+            return await self._get(uri)
+
+        # Cache files are read, decoded and written in the default executor, so they block neither
+        # the caller's event loop nor the requests running on this one
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self.cache.load, uri)
+        if data is not ResponseCache.MISS:
+            return data
+        if self.cache.mode == 'replay' and self.cache.cacheable(uri):
+            raise APIError(f'Response is not recorded: {uri}')
+
+        data = await self._get(uri)
+        await loop.run_in_executor(None, self.cache.store, uri, data)
+        return data
+
+    async def _get(self, uri):
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+            )
+
+        url = self.__url + uri
+        delay = 0
+        for attempt in range(self.max_retries + 1):
+            await self.breaker.wait_async()
+            try:
+                async with self._semaphore:
+                    async with self._session.get(url) as response:
+                        if response.status != 429 and response.status <= 201:
+                            self.breaker.success()
+                            return await self.process_response(response)
+                        if response.status == 403:
+                            raise APIError('Access denied.')
+                        if response.status == 400:
+                            raise APIError('Invalid data or entity not found.')
+                        delay = self.retry.backoff(self.breaker, delay, response.headers.get('Retry-After'))
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                delay = self.retry.backoff(self.breaker, delay)
+
+            if attempt == self.max_retries:
+                raise APIError('Max retries reached or server error.')
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def process_response(response):
+        try:
+            return json_codec.loads(await response.read())
+        except:
+            raise APIError('Failed to parse JSON response')
+
+    def close(self):
+        async def close_session():
+            if self._session is not None:
+                await self._session.close()
+
+        asyncio.run_coroutine_threadsafe(close_session(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -1,9 +1,9 @@
 import asyncio
 
 from ..service import QaseService, TestrailService
-from ..support import Logger, Mappings, ConfigManager as Config, Pools
+from ..support import Logger, Mappings, ConfigManager as Config, Pools, AttachmentFile, AttachmentsCache
 
-from typing import List
+from typing import List, Optional
 
 from io import BytesIO
 
@@ -12,6 +12,13 @@ from urllib.parse import unquote
 import re
 import os
 import json
+import hashlib
+import time
+
+
+# Markdown image links to TestRail attachments and bare attachment links
+ATTACHMENT_PATTERN = re.compile(r'!\[\]\(index\.php\?/attachments/get/([a-f0-9-]+)\)')
+ATTACHMENT_ID_PATTERN = re.compile(r'index\.php\?/attachments/get/([a-f0-9-]+)')
 
 
 class Attachments:
@@ -30,94 +37,171 @@ class Attachments:
         self.config = config
         self.mappings = mappings
         self.pools = pools
-        self.pattern = r'!\[\]\(index\.php\?/attachments/get/([a-f0-9-]+)\)'
+        self.pattern = ATTACHMENT_PATTERN
+        # Streaming mode downloads attachments in chunks and spools anything above spool_size to disk
+        self.stream = bool(self.config.get('attachments.stream'))
+        self.spool_size = self.config.get('attachments.spool_size') or 8 * 1024 * 1024
+        self.chunk_size = 64 * 1024
+        # Lazy mode skips the upfront import and transfers only attachments referenced by migrated entities
+        self.lazy = bool(self.config.get('attachments.lazy'))
+        # During the bulk import small attachments are grouped per project into multi-file upload requests.
+        # Qase accepts up to 20 files and 128 Mb per request
+        self.batching = False
+        self.batch_size = min(self.config.get('attachments.batch.files') or 20, 20)
+        self.batch_bytes = self.config.get('attachments.batch.bytes') or 16 * 1024 * 1024
+        self.batch_file_size = self.config.get('attachments.batch.max_file_size') or 1024 * 1024
+        self.batch_linger = 0.5
+        self.batches = {}
+        self.batch_tasks = set()
+        # Attachments above large_size are downloaded and uploaded in the dedicated large lane of the pools
+        self.large_size = self.config.get('attachments.large_size') or 16 * 1024 * 1024
 
-    def check_and_replace_attachments(self, string: str, code: str) -> str:
+    async def check_and_replace_attachments(self, string: str, code: str) -> str:
         if string:
-            attachments = self.check_attachments(string)
-            if (attachments):
-                return self.replace_attachments(string=string, code = code)
+            string = str(string)
+            # Cheap substring check first, most fields have no attachments at all
+            if 'index.php?/attachments/get/' in string:
+                await self.replace_missing(self.pattern.findall(string), code)
+                return self.replace_attachments(string=string, code=code)
         return str(string)
     
-    def check_and_replace_attachments_array(self, attachments: list, code: str) -> list:
+    async def check_and_replace_attachments_array(self, attachments: list, code: str) -> list:
+        attachments = [re.sub(r'^E_', '', attachment) for attachment in attachments if attachment]
+        for attachment in attachments:
+            self.add_reference(attachment)
+        await self.replace_missing(attachments, code)
+
         result = []
         for attachment in attachments:
-            if attachment:
-                attachment = re.sub(r'^E_', '', attachment)
-            if attachment and attachment not in self.mappings.attachments_map:
-                self.logger.log(f'[Attachments] Attachment {attachment} not found in attachments_map (array)', 'warning')
-                self.replace_failover(attachment, code)
-            if attachment and attachment in self.mappings.attachments_map and self.mappings.attachments_map[attachment] and 'hash' in self.mappings.attachments_map[attachment]:
+            if attachment in self.mappings.attachments_map and self.mappings.attachments_map[attachment] and 'hash' in self.mappings.attachments_map[attachment]:
                 result.append(self.mappings.attachments_map[attachment]['hash'])
         return result
+
+    async def replace_missing(self, attachments: list, code: str) -> None:
+        missing = {attachment for attachment in attachments if attachment not in self.mappings.attachments_map}
+        if missing:
+            async with asyncio.TaskGroup() as tg:
+                for attachment in missing:
+                    self.logger.log(f'[Attachments] Attachment {attachment} not found in attachments_map', 'warning')
+                    tg.create_task(self.replace_failover(attachment, code))
     
     def check_attachments(self, string: str) -> List:
         if (string):
-            return re.findall(r'index\.php\?/attachments/get/([a-f0-9-]+)', str(string))
+            attachments = ATTACHMENT_ID_PATTERN.findall(str(string))
+            for attachment in attachments:
+                self.add_reference(attachment)
+            return attachments
         return []
+
+    # Index of attachment ids referenced by the entities being migrated
+    def add_reference(self, attachment_id) -> None:
+        if attachment_id not in self.mappings.attachments_refs:
+            self.mappings.attachments_refs.add(attachment_id)
+            self.mappings.stats.add_attachment('referenced')
     
+    def _read_attachment(self, data):
+        try:
+            if self.stream:
+                return self._spool_attachment(data)
+            return self._get_attachment_meta(data)
+        finally:
+            data.close()
+
+    @staticmethod
+    def _get_attachment_size(value) -> Optional[int]:
+        if hasattr(value, 'headers'):
+            value = value.headers.get('Content-Length')
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _get_lane(self, size: Optional[int]) -> str:
+        if size is not None and size > self.large_size:
+            return 'large'
+        return 'small'
+
     def _get_attachment_meta(self, data: dict) -> dict:
         content = BytesIO(data.content)
         content.mime = data.headers.get('Content-Type', '')
-        content.name = "attachment"
+        content.name = self._get_attachment_name(data)
+        content.digest = hashlib.sha256(data.content).hexdigest()
+        content.size = len(data.content)
+
+        return content
+
+    def _spool_attachment(self, data) -> AttachmentFile:
+        content = AttachmentFile(self._get_attachment_name(data), data.headers.get('Content-Type', ''), self.spool_size)
+        for chunk in data.iter_content(chunk_size=self.chunk_size):
+            content.write(chunk)
+        return content
+
+    @staticmethod
+    def _get_attachment_name(data) -> str:
         filename_header = data.headers.get('Content-Disposition', '')
         match = re.search(r"filename\*=UTF-8''(.+)", filename_header)
         if match:
-            content.name = unquote(match.group(1))
-
-        return content
+            return unquote(match.group(1))
+        return "attachment"
 
     def replace_attachments(self, string: str, code: str) -> str:
-        string = re.sub(r'^E_', '', string)
-        try:
+        string = string.removeprefix('E_')
 
-            matches = re.finditer(self.pattern, string)
-            for match in matches:
-                attachment_id = match.group(1)
-                if attachment_id not in self.mappings.attachments_map:
-                    self.logger.log(f'[Attachments] Attachment {attachment_id} not found in attachments_map', 'warning')
-                    self.replace_failover(attachment_id, code)
-                string = self.replace_string(string, code, attachment_id)
-            else:
-                self.logger.log(f'[Attachments] No attachments found in a string {string}', 'warning')
+        # Every link is resolved and rewritten in a single pass over the string
+        def replace(match: re.Match) -> str:
+            attachment_id = match.group(1)
+            self.add_reference(attachment_id)
+            attachment = self.mappings.attachments_map.get(attachment_id)
+            if not attachment:
+                self.logger.log(f'[Attachments] Attachment {attachment_id} could not be replaced', 'warning')
+                return match.group(0)
+            return f'![{attachment["filename"]}]({attachment["url"]})'
+
+        try:
+            return self.pattern.sub(replace, string)
         except Exception as e:
             self.logger.log(f'[Attachments] Exception when replacing attachments in a string {string}: {e}', 'error')
         return string
     
-    def replace_failover(self, attachment_id, code: str):
-        try:
-            self.logger.log(f'[Attachments] Replacing attachment {attachment_id} in failover')
-            attachment_data = self._get_attachment_meta(self.testrail.get_attachment(attachment_id))
-            qase_attachment = self.qase.upload_attachment(code, attachment_data)
-            if qase_attachment:
-                self.mappings.attachments_map[attachment_id] = qase_attachment
-                self.logger.log(f'[Attachments] Attachment {attachment_id} replaced in failover')
-            else:
-                self.logger.log(f'[Attachments] Attachment {attachment_id} not replaced in failover', 'error')
-        except Exception as e:
-            self.logger.log(f'[Attachments] Exception when calling Qase->upload_attachment in failover: {e}', 'error')
-    
-    def replace_string(self, string, code, attachment_id):
-        return re.sub(
-            f'!\\[\\]\\(index\\.php\\?/attachments/get/{attachment_id}\\)',
-            f'![{self.mappings.attachments_map[attachment_id]["filename"]}]({self.mappings.attachments_map[attachment_id]["url"]})',
-            string
-        )
+    # Missing attachments are transferred on the pools. Concurrent callers waiting for the same attachment
+    # share a single transfer instead of uploading it again
+    async def replace_failover(self, attachment_id, code: str):
+        self.logger.log(f'[Attachments] Replacing attachment {attachment_id} in failover')
+        await self.mappings.attachments_flight.do(attachment_id, self._replace_failover, attachment_id, code)
 
+    async def _replace_failover(self, attachment_id, code: str):
+        if attachment_id in self.mappings.attachments_map:
+            return
+        await self.import_attachment(attachment_id, code)
+        if attachment_id in self.mappings.attachments_map:
+            self.logger.log(f'[Attachments] Attachment {attachment_id} replaced in failover')
+        else:
+            self.logger.log(f'[Attachments] Attachment {attachment_id} not replaced in failover', 'error')
+    
     def import_all_attachments(self) -> Mappings:
         return asyncio.run(self.import_all_attachments_async())
 
     async def import_all_attachments_async(self) -> Mappings:
+        if self.lazy:
+            # Attachments are transferred on demand when cases, suites and results referencing them are imported
+            self.logger.log('[Attachments] Lazy mode is enabled, attachments will be imported on demand')
+            if self.config.get('cache'):
+                self._read_cache()
+            return self.mappings
+
         self.logger.log('[Attachments] Importing all attachments')
-        attachments_raw = self.testrail.get_attachments_list()
+        attachments_raw = await self.pools.tr(self.testrail.get_attachments_list)
         self.mappings.stats.add_attachment('testrail', len(attachments_raw))
 
         if self.config.get('cache'):
             self._save_cache(attachments_raw)
+            self._read_cache()
 
-        async with asyncio.TaskGroup() as tg:
+        self.batching = self.batch_size > 1
+        async with self.pools.window() as window:
             for attachment in attachments_raw:
-                tg.create_task(self.import_raw_attachment(attachment))
+                await window.spawn(self.import_raw_attachment(attachment))
+        self.batching = False
 
         self.logger.log(f'[Attachments] Imported {len(attachments_raw)} attachments')
 
@@ -129,41 +213,169 @@ class Attachments:
             self.logger.log(f'[Attachments] Attachment {attachment["id"]} is linked to multiple projects', 'warning')
         if len(attachment['project_id']) > 0:
             if attachment['project_id'][0] in self.mappings.project_map:
-                code = self.mappings.project_map[attachment['project_id'][0]]
-                try: 
-                    meta = self._get_attachment_meta(await self.pools.tr(self.testrail.get_attachment, attachment['id']))
-                except Exception as e:
-                    self.logger.log(f'[Attachments] Exception when calling TestRail->get_attachment: {e}', 'error')
-                    return
-
-                try:
-                    qase_attachment = await self.pools.qs(self.qase.upload_attachment, code, meta)
-                    if qase_attachment:
-                        self.mappings.attachments_map[attachment['id']] = qase_attachment
-                        self.logger.log(f'[Attachments] Attachment {attachment["id"]} imported')
-                        self.mappings.stats.add_attachment('qase')
-                    else:
-                        self.logger.log(f'[Attachments] Attachment {attachment["id"]} not imported', 'error')
-                except Exception as e:
-                    self.logger.log(f'[Attachments] Exception when calling Qase->upload_attachment: {e}', 'error')
+                await self.import_attachment(
+                    attachment['id'],
+                    self.mappings.project_map[attachment['project_id'][0]],
+                    self._get_attachment_size(attachment.get('size')),
+                )
             else:
                 self.logger.log(f'[Attachments] Attachment {attachment["id"]} is not linked to any project', 'error')
         else:
             self.logger.log(f'[Attachments] Attachment {attachment["id"]} is not linked to any project', 'warning')
 
+    async def import_attachment(self, attachment_id, code: str, size: Optional[int] = None):
+        if self._from_cache(attachment_id, code):
+            return
+        started = time.monotonic()
+        try:
+            # Only headers are read here. The size decides which lane downloads the body and uploads it
+            lane = self._get_lane(size)
+            opener = self.pools.large if lane == 'large' else self.pools.tr
+            response = await opener(self.testrail.get_attachment, attachment_id, True)
+            lane = self._get_lane(self._get_attachment_size(response) or size)
+            reader = self.pools.large if lane == 'large' else self.pools.tr
+            meta = await reader(self._read_attachment, response)
+        except Exception as e:
+            self.logger.log(f'[Attachments] Exception when calling TestRail->get_attachment: {e}', 'error')
+            return
+
+        try:
+            qase_attachment = self._find_duplicate(code, meta)
+            if not qase_attachment:
+                qase_attachment = await self._upload_unique(code, meta, lane)
+            if qase_attachment:
+                self.mappings.attachments_map[attachment_id] = qase_attachment
+                self._to_cache(attachment_id, code, meta, qase_attachment)
+                self.mappings.stats.add_lane_transfer(lane, meta.size, time.monotonic() - started)
+                self.logger.log(f'[Attachments] Attachment {attachment_id} imported')
+                self.mappings.stats.add_attachment('qase')
+            else:
+                self.logger.log(f'[Attachments] Attachment {attachment_id} not imported', 'error')
+        except Exception as e:
+            self.logger.log(f'[Attachments] Exception when calling Qase->upload_attachment: {e}', 'error')
+        finally:
+            meta.close()
+
+    # Copies of a payload transferred to one project at the same time share a single upload
+    async def _upload_unique(self, code: str, meta, lane: str = 'small') -> Optional[dict]:
+        uploaded = False
+
+        async def upload():
+            nonlocal uploaded
+            # An upload of the same payload may have finished after the duplicate check
+            qase_attachment = self.mappings.attachments_digests.get(code, {}).get(meta.digest)
+            if qase_attachment:
+                return qase_attachment
+            uploaded = True
+            qase_attachment = await self._upload(code, meta, lane)
+            self._remember_digest(code, meta, qase_attachment)
+            return qase_attachment
+
+        qase_attachment = await self.mappings.attachments_flight.do(('upload', code, meta.digest), upload)
+        if qase_attachment and not uploaded:
+            self.logger.log(f'[Attachments] Attachment {meta.name} is a duplicate of {qase_attachment["hash"]}')
+            self.mappings.stats.add_attachment('deduplicated')
+        return qase_attachment
+
+    async def _upload(self, code: str, meta, lane: str = 'small') -> Optional[dict]:
+        if lane == 'large':
+            return await self.pools.large_qs(self.qase.upload_attachment, code, meta)
+        if self.batching and meta.size <= self.batch_file_size:
+            return await self._upload_batched(code, meta)
+        return await self.pools.qs(self.qase.upload_attachment, code, meta)
+
+    async def _upload_batched(self, code: str, meta) -> Optional[dict]:
+        batch = self.batches.get(code)
+        if batch and (len(batch['items']) >= self.batch_size or batch['bytes'] + meta.size > self.batch_bytes):
+            self._flush_batch(code)
+            batch = None
+        if batch is None:
+            # A batch that is not filled in time is sent anyway, so no attachment waits for long
+            batch = self.batches[code] = {
+                'items': [],
+                'bytes': 0,
+                'timer': asyncio.get_running_loop().call_later(self.batch_linger, self._flush_batch, code),
+            }
+
+        future = asyncio.get_running_loop().create_future()
+        batch['items'].append((meta, future))
+        batch['bytes'] += meta.size
+        if len(batch['items']) >= self.batch_size:
+            self._flush_batch(code)
+        return await future
+
+    def _flush_batch(self, code: str) -> None:
+        batch = self.batches.pop(code, None)
+        if batch is None:
+            return
+        batch['timer'].cancel()
+        task = asyncio.get_running_loop().create_task(self._send_batch(code, batch['items']))
+        self.batch_tasks.add(task)
+        task.add_done_callback(self.batch_tasks.discard)
+
+    async def _send_batch(self, code: str, items: list) -> None:
+        self.logger.log(f'[Attachments] Uploading {len(items)} attachments to {code} in one request')
+        try:
+            uploaded = await self.pools.qs(self.qase.upload_attachments, code, [meta for meta, _ in items])
+        except Exception as e:
+            self.logger.log(f'[Attachments] Exception when calling Qase->upload_attachments: {e}', 'error')
+            uploaded = []
+        if not uploaded and len(items) > 1:
+            # Fall back to one request per file, so a single rejected file does not fail the whole batch
+            self.logger.log(f'[Attachments] Batch upload to {code} failed, uploading {len(items)} attachments one by one', 'warning')
+            uploaded = await asyncio.gather(*(self.pools.qs(self.qase.upload_attachment, code, meta) for meta, _ in items))
+        for i, (meta, future) in enumerate(items):
+            if not future.done():
+                future.set_result(uploaded[i] if i < len(uploaded) else None)
+
+    # Identical payloads are uploaded once per project, later copies reuse the Qase attachment
+    def _find_duplicate(self, code: str, attachment_data) -> Optional[dict]:
+        qase_attachment = self.mappings.attachments_digests.get(code, {}).get(attachment_data.digest)
+        if qase_attachment:
+            self.logger.log(f'[Attachments] Attachment {attachment_data.name} is a duplicate of {qase_attachment["hash"]}')
+            self.mappings.stats.add_attachment('deduplicated')
+        return qase_attachment
+
+    def _remember_digest(self, code: str, attachment_data, qase_attachment: Optional[dict]) -> None:
+        if qase_attachment:
+            self.mappings.attachments_digests.setdefault(code, {})[attachment_data.digest] = qase_attachment
+
+    def _from_cache(self, attachment_id: str, code: str) -> bool:
+        if self.mappings.attachments_cache is None:
+            return False
+        qase_attachment = self.mappings.attachments_cache.get(attachment_id, code)
+        if qase_attachment:
+            self.mappings.attachments_map[attachment_id] = qase_attachment
+            self.mappings.stats.add_attachment('cached')
+            self.logger.log(f'[Attachments] Attachment {attachment_id} found in cache')
+            return True
+        return False
+
+    def _to_cache(self, attachment_id: str, code: str, attachment_data, qase_attachment: dict) -> None:
+        if self.mappings.attachments_cache is not None:
+            self.mappings.attachments_cache.add(attachment_id, code, qase_attachment, attachment_data.digest)
+
     def _read_cache(self):
-        return
+        if self.mappings.attachments_cache is not None:
+            return
+        self.mappings.attachments_cache = AttachmentsCache(self._get_cache_file('attachments_map.jsonl'))
+        for code, digests in self.mappings.attachments_cache.digests().items():
+            self.mappings.attachments_digests.setdefault(code, {}).update(digests)
+        self.logger.log(f'[Attachments] Loaded {len(self.mappings.attachments_cache)} attachments from cache')
 
-    def _save_cache(self, attachments):
-        self.logger.log('[Attachments] Saving attachments cache')
+    def _get_cache_file(self, name: str) -> str:
         prefix = ''
         if self.config.get('prefix'):
             prefix = self.config.get('prefix')
-        filename = f'{prefix}_attachments.json'
+        filename = f'{prefix}_{name}'
         log_dir = './cache'
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
-        cache_file = os.path.join(log_dir, f'{filename}')
+        return os.path.join(log_dir, f'{filename}')
+
+    def _save_cache(self, attachments):
+        self.logger.log('[Attachments] Saving attachments cache')
+        cache_file = self._get_cache_file('attachments.json')
         with open(cache_file, 'w') as f:
             f.write(json.dumps(attachments))
         self.logger.log('[Attachments] Attachments cache saved')
@@ -100,7 +100,7 @@ class Cases:
         }
 
         # import custom fields
-        data = self._import_custom_fields_for_case(case=case, data=data)
+        data = await self._import_custom_fields_for_case(case=case, data=data)
         data = await self._get_attachments_for_case(case=case, data=data)
 
         data = self._set_priority(case=case, data=data)
@@ -142,6 +142,9 @@ class Cases:
                 id = attachment['id']
                 if 'data_id' in attachment:
                     id = attachment['data_id']
+                self.attachments.add_reference(id)
+                if id not in self.mappings.attachments_map and self.attachments.lazy:
+                    await self.attachments.replace_failover(id, self.project['code'])
                 if id in self.mappings.attachments_map:
                     data['attachments'].append(self.mappings.attachments_map[id]['hash'])
             except Exception as e:
@@ -149,7 +152,7 @@ class Cases:
         return data
     
     # Done
-    def _import_custom_fields_for_case(self, case: dict, data: dict) -> dict:
+    async def _import_custom_fields_for_case(self, case: dict, data: dict) -> dict:
         for field_name in case:
             if field_name.startswith('custom_') and field_name[len('custom_'):] in self.mappings.custom_fields and case[field_name]:
                 name = field_name[len('custom_'):]
@@ -165,13 +168,13 @@ class Cases:
                         if type(value) == list:
                             data['custom_field'][str(custom_field['qase_id'])] = ','.join(str(int(v)+1) for v in value)
                 else:
-                    data['custom_field'][str(custom_field['qase_id'])] = str(self.attachments.check_and_replace_attachments(case[field_name], self.project['code']))
+                    data['custom_field'][str(custom_field['qase_id'])] = str(await self.attachments.check_and_replace_attachments(case[field_name], self.project['code']))
             if field_name[len('custom_'):] in self.mappings.step_fields and case[field_name]:
                 steps = []
                 i = 1
                 for step in case[field_name]:
-                    action = self.attachments.check_and_replace_attachments(step['content'], self.project['code'])
-                    expected = self.attachments.check_and_replace_attachments(step['expected'], self.project['code'])
+                    action = await self.attachments.check_and_replace_attachments(step['content'], self.project['code'])
+                    expected = await self.attachments.check_and_replace_attachments(step['expected'], self.project['code'])
 
                     action = action.strip()
                     expected = expected.strip()
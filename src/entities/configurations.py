@@ -27,7 +27,7 @@ class Configurations:
 
     async def import_configurations_async(self, project) -> Mappings:
         self.logger.log(f"[{project['code']}][Configurations] Importing configurations")
-        configs = self.testrail.get_configurations(project['testrail_id'])
+        configs = await self.pools.tr(self.testrail.get_configurations, project['testrail_id'])
         if configs:
             self.logger.log(f"[{project['code']}][Configurations] Found {len(configs)} configurations")
             async with asyncio.TaskGroup() as tg:
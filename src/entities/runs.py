@@ -32,6 +32,8 @@ class Runs:
 
         self.created_after = self.config.get('runs.created_after')
         self.index = []
+        # Window of result chunks in flight, shared by all runs of the project
+        self.results_window = None
         self.logger.divider()
 
     def import_runs(self) -> None:
@@ -43,11 +45,14 @@ class Runs:
         self.logger.log(f'[{self.project["code"]}][Runs] Found {str(len(self.index))} runs')
         self.index.sort(key=lambda x: x['created_on'])
         i = 0
-        async with asyncio.TaskGroup() as tg:
-            for run in self.index:
-                i += 1
-                self.logger.print_status(f'[{self.project["code"]}] Importing runs', i, len(self.index), 1)
-                tg.create_task(self._import_run(run))
+        # Runs are read from TestRail a window at a time. Their result chunks share one window of the Qase pool,
+        # so chunks in flight do not multiply with the runs in flight
+        async with self.pools.qs_window() as self.results_window:
+            async with self.pools.tr_window() as window:
+                for run in self.index:
+                    i += 1
+                    self.logger.print_status(f'[{self.project["code"]}] Importing runs', i, len(self.index), 1)
+                    await window.spawn(self._import_run(run))
 
     async def _build_index(self) -> None:
         self.logger.log(f'[{self.project["code"]}][Runs] Building index for project {self.project["name"]}')
@@ -99,7 +104,7 @@ class Runs:
             self.logger.log(f'[{self.project["code"]}][Runs] Fetching plans from TestRail')
             plans = await self.pools.tr(self.testrail.get_plans, self.project['testrail_id'], limit, offset)
             for plan in plans['plans']:
-                plan = self.testrail.get_plan(plan['id'])
+                plan = await self.pools.tr(self.testrail.get_plan, plan['id'])
                 if plan is not None and 'entries' in plan and plan['entries'] and len(plan['entries']) > 0:
                     self.logger.log(f'[{self.project["code"]}][Runs] Fetching runs for plan {plan["id"]}')
                     for entry in plan['entries']:
@@ -151,7 +156,7 @@ class Runs:
         while True:
             self.logger.log(f'[{self.project["code"]}][Runs] Fetching results for the run {run["name"]} [{run["id"]}]')
             results = await self.pools.tr(self.testrail.get_results, run['id'], limit, offset)
-            run_results = run_results + self._clean_results(results['results'])
+            run_results = run_results + await self._clean_results(results['results'])
             offset = offset + limit
             if results['size'] < limit:
                 break
@@ -181,11 +186,10 @@ class Runs:
         run_results = sorted(run_results, key=lambda x: x['created_on'])
         
         i = 0
-        async with asyncio.TaskGroup() as tg:
-            for chunk in self._chunk_list_generator(run_results, 500):
-                i += 1
-                self.logger.log(f'[{self.project["code"]}][Runs] Importing results [Chunk {i}] for the run {run["name"]} [{run["id"]}]')
-                tg.create_task(self._import_results(run, qase_run_id, cases_map, chunk))
+        for chunk in self._chunk_list_generator(run_results, 500):
+            i += 1
+            self.logger.log(f'[{self.project["code"]}][Runs] Importing results [Chunk {i}] for the run {run["name"]} [{run["id"]}]')
+            await self.results_window.spawn(self._import_results(run, qase_run_id, cases_map, chunk))
 
     @staticmethod
     def _chunk_list_generator(results, chunk_size = 500):
@@ -193,12 +197,12 @@ class Runs:
         for i in range(0, len(results), chunk_size):
             yield results[i:i + chunk_size]
 
-    def _clean_results(self, results: list) -> list:
+    async def _clean_results(self, results: list) -> list:
         clean_results = []
         for result in results:
             if result['status_id'] != 3:
                 if len(result['attachment_ids']) > 0:
-                    result['attachments'] = self.attachments.check_and_replace_attachments_array(result['attachment_ids'], self.project['code'])
+                    result['attachments'] = await self.attachments.check_and_replace_attachments_array(result['attachment_ids'], self.project['code'])
                 del result['attachment_ids']
                 del result['version']
                 clean_results.append(result)
@@ -33,7 +33,7 @@ class SharedSteps:
 
         shared_steps = []
         while True:
-            tr_shared = self.testrail.get_shared_steps(project['testrail_id'], limit, offset)
+            tr_shared = await self.pools.tr(self.testrail.get_shared_steps, project['testrail_id'], limit, offset)
             shared_steps += tr_shared['shared_steps']
             if tr_shared['size'] < limit:
                 break
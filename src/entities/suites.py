@@ -42,7 +42,7 @@ class Suites:
                 i = 0
                 for suite in suites:
                     self.logger.print_status('['+project['code']+'] Importing suites', i, len(suites), 1)
-                    description = self.attachments.check_and_replace_attachments(suite['description'], project['code'])
+                    description = await self.attachments.check_and_replace_attachments(suite['description'], project['code'])
                     tg.create_task(self.import_suite(description, project, suite))
 
             else:
@@ -96,7 +96,7 @@ class Suites:
             testrail_suite_id: Optional[int] = None
     ):
         description = description if description else ""
-        description = self.attachments.check_and_replace_attachments(description, qase_code)
+        description = await self.attachments.check_and_replace_attachments(description, qase_code)
         parent_id = self.suites_map.get(parent_id, None) if parent_id else None
 
         self.suites_map[testrail_suite_id] = await self.pools.qs(
@@ -112,5 +112,5 @@ class Suites:
     def _get_sections(self, project_id: int, suite_id: int = 0, offset: int = 0, limit: int = 100) -> List:
         sections = self.testrail.get_sections(project_id, limit, offset, suite_id)
         if (len(sections) > 0 and len(sections) == limit):
-            sections += self._get_sections(project_id, suite_id, offset + limit, limit)
+            sections = sections + self._get_sections(project_id, suite_id, offset + limit, limit)
         return sections
\ No newline at end of file
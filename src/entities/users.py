@@ -45,27 +45,28 @@ class Users:
 
     async def build_map(self):
         self.logger.log("[Users] Building users map")
-        qase_users = await self.pools.qs_gen_all(self.qase.get_all_users)
-        self.mappings.stats.add_user('qase', len(qase_users))
-        self.mappings.stats.add_user('testrail', len(self.testrail_users))
-        i = 0
-        total = len(self.testrail_users)
-        self.logger.print_status('Building users map', i, total)
+        # Qase users are matched by email page by page, as they are loaded
+        testrail_users = {}
         for testrail_user in self.testrail_users:
-            i += 1
-            flag = False
-            for qase_user in qase_users:
-                qase_user = qase_user.to_dict()
-                if testrail_user['email'].lower() == qase_user['email'].lower():
-                    self.mappings.users[testrail_user['id']] = qase_user['id']
-                    flag = True
-                    self.logger.log(f"[Users] User {testrail_user['email']} found in Qase as {qase_user['email']}")
-                    break
-            if not flag:
+            testrail_users.setdefault(testrail_user['email'].lower(), []).append(testrail_user)
+
+        qase_total = 0
+        async for qase_user in self.pools.qs_items(self.qase.get_all_users):
+            qase_total += 1
+            qase_user = qase_user.to_dict()
+            for testrail_user in testrail_users.pop(qase_user['email'].lower(), []):
+                self.mappings.users[testrail_user['id']] = qase_user['id']
+                self.logger.log(f"[Users] User {testrail_user['email']} found in Qase as {qase_user['email']}")
+
+        self.mappings.stats.add_user('qase', qase_total)
+        self.mappings.stats.add_user('testrail', len(self.testrail_users))
+
+        for unmatched in testrail_users.values():
+            for testrail_user in unmatched:
                 # Not found, using default user
                 self.mappings.users[testrail_user['id']] = self.config.get('users.default')
                 self.logger.log(f"[Users] User {testrail_user['email']} not found in Qase, using default user.")
-            self.logger.print_status('Building users map', i, total)
+        self.logger.print_status('Building users map', len(self.testrail_users), len(self.testrail_users))
 
     async def create_root_group(self):
         if self.config.get('groups.name') is not None:
@@ -76,7 +77,7 @@ class Users:
         self.mappings.group_id = await self.pools.qs(self.scim.create_group, group_name)
         for id in self.active_ids:
             self.logger.log(f"[Users] Adding user {id} to group {group_name}")
-            self.scim.add_user_to_group(self.mappings.group_id, id)
+            await self.pools.qs(self.scim.add_user_to_group, self.mappings.group_id, id)
 
     async def create_users(self):
         self.logger.log("[Users] Loading users from Qase using SCIM")
@@ -152,23 +153,25 @@ class Users:
 
     async def import_groups(self):
         self.logger.log("[Users] Importing groups from TestRail")
-        groups = await self.pools.tr_gen_all(self.get_all_groups)
-        self.logger.log(f"[Users] Found {len(groups)} groups in TestRail")
+        total = 0
 
-        async with asyncio.TaskGroup() as tg:
-            for group in groups:
-                tg.create_task(self.import_group(group))
+        # Groups are imported as they are loaded, page by page
+        async with self.pools.qs_window() as window:
+            async for group in self.pools.tr_items(self.get_all_groups):
+                total += 1
+                await window.spawn(self.import_group(group))
+        self.logger.log(f"[Users] Found {total} groups in TestRail")
 
     async def import_group(self, group):
         self.logger.log(f"[Users] Importing group {group['name']}")
         group_id = await self.pools.qs(self.scim.create_group, group['name'])
 
-        async with asyncio.TaskGroup() as tg:
+        async with self.pools.qs_window() as window:
             for id in group['user_ids']:
                 if id in self.map:
                     if self.map[id] in self.active_ids:
                         self.logger.log(f"[Users] Adding user {id} to group {group['name']}")
-                        tg.create_task(self.pools.qs_task(self.scim.add_user_to_group, group_id, self.map[id]))
+                        await window.spawn(self.pools.qs_task(self.scim.add_user_to_group, group_id, self.map[id]))
                     else:
                         self.logger.log(f"[Users] User {id} is not active, skipping adding to group {group['name']}")
 
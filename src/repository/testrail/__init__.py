@@ -1,7 +1,9 @@
 from .api import TestrailApiRepository
 from .db import TestrailDbRepository
+from .api_async import TestrailAsyncApiRepository
 
 __all__ = [
     'TestrailApiRepository',
-    'TestrailDbRepository'
+    'TestrailDbRepository',
+    'TestrailAsyncApiRepository'
 ]
\ No newline at end of file
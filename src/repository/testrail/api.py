@@ -66,8 +66,8 @@ class TestrailApiRepository:
     def get_results(self, run_id: int, limit: int = 250, offset: int = 0):
         return self.client.get('get_results_for_run/' + str(run_id) + f'&limit={limit}&offset={offset}')
     
-    def get_attachment(self, attachment):
-        return self.client.get_attachment(attachment)
+    def get_attachment(self, attachment, stream = False):
+        return self.client.get_attachment(attachment, stream)
     
     def get_attachments_list(self):
         return self.client.get_attachments_list()
@@ -0,0 +1,85 @@
+from ...api.testrail_async import TestrailAsyncApiClient
+
+class TestrailAsyncApiRepository:
+    def __init__(self, client: TestrailAsyncApiClient):
+        self.client = client
+
+    async def get_all_users(self):
+        return await self.client.get('get_users')
+
+    async def get_users(self, limit = 250, offset = 0):
+        return await self.client.get('get_users/' + f'&limit={limit}&offset={offset}')
+
+    async def get_groups(self, limit = 250, offset = 0):
+        return await self.client.get('get_groups/' + f'&limit={limit}&offset={offset}')
+
+    async def get_case_types(self):
+        return await self.client.get('get_case_types')
+
+    async def get_result_statuses(self):
+        return await self.client.get('get_statuses')
+
+    async def get_case_statuses(self):
+        return await self.client.get('get_case_statuses')
+
+    async def get_priorities(self):
+        return await self.client.get('get_priorities')
+
+    async def get_case_fields(self):
+        return await self.client.get('get_case_fields')
+
+    async def get_configurations(self, project_id: int):
+        return await self.client.get('get_configs/' + str(project_id))
+
+    async def get_projects(self, limit = 250, offset = 0):
+        return await self.client.get('get_projects/' + f'&limit={limit}&offset={offset}')
+
+    async def get_suites(self, project_id, offset = 0, limit = 100):
+        suites = await self.client.get('get_suites/' + str(project_id) + f'&limit={limit}&offset={offset}')
+        if (suites and len(suites) == limit):
+            suites += await self.get_suites(project_id, offset + limit, limit)
+        return suites
+
+    async def get_sections(self, project_id: int, limit: int = 100, offset: int = 0, suite_id: int = 0):
+        uri = 'get_sections/' + str(project_id) + f'&limit={limit}&offset={offset}'
+        if (suite_id > 0):
+            uri += f'&suite_id={suite_id}'
+        return await self.client.get(uri)
+
+    async def get_shared_steps(self, project_id: int, limit: int = 250, offset: int = 0):
+        return await self.client.get('get_shared_steps/' + str(project_id) + f'&limit={limit}&offset={offset}')
+
+    async def get_cases(self, project_id: int, suite_id: int = 0, limit: int = 250, offset: int = 0) -> dict:
+        uri = 'get_cases/' + str(project_id) + f'&limit={limit}&offset={offset}'
+        if (suite_id > 0):
+            uri += f'&suite_id={suite_id}'
+        return await self.client.get(uri)
+
+    async def get_runs(self, project_id: int, suite_id: int = 0, created_after: int = 0, limit: int = 250, offset: int = 0):
+        uri = 'get_runs/' + str(project_id) + f'&limit={limit}&offset={offset}'
+        if (created_after > 0):
+            uri += f'&created_after={created_after}'
+        if (suite_id > 0):
+            uri += f'&suite_id={suite_id}'
+        return await self.client.get(uri)
+
+    async def get_results(self, run_id: int, limit: int = 250, offset: int = 0):
+        return await self.client.get('get_results_for_run/' + str(run_id) + f'&limit={limit}&offset={offset}')
+
+    async def get_attachments_case(self, case_id: int):
+        return await self.client.get('get_attachments_for_case/' + str(case_id))
+
+    async def get_test(self, test_id: int):
+        return await self.client.get('get_test/' + str(test_id))
+
+    async def get_tests(self, run_id: int, limit: int = 250, offset: int = 0):
+        return await self.client.get('get_tests/' + str(run_id) + f'&limit={limit}&offset={offset}')
+
+    async def get_plans(self, project_id: int, limit: int = 250, offset: int = 0):
+        return await self.client.get('get_plans/' + str(project_id) + f'&limit={limit}&offset={offset}')
+
+    async def get_plan(self, plan_id: int):
+        return await self.client.get('get_plan/' + str(plan_id))
+
+    async def get_milestones(self, project_id: int, limit: int = 250, offset: int = 0):
+        return await self.client.get('get_milestones/' + str(project_id) + f'&limit={limit}&offset={offset}')
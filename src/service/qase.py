@@ -1,8 +1,11 @@
-from ..support import ConfigManager, Logger
+from ..support import ConfigManager, Logger, AttachmentFile, MultipartStream, RetryPolicy, json_codec
+from ..support.operations import operation, current_budget, HIGH, NORMAL, LOW
 
 import certifi
-import json
+import time
+from urllib.parse import urlparse
 
+from qaseio import rest, api_client
 from qaseio.api_client import ApiClient
 from qaseio.configuration import Configuration
 from qaseio.api.authors_api import AuthorsApi
@@ -18,7 +21,7 @@ from qaseio.api.milestones_api import MilestonesApi
 from qaseio.api.configurations_api import ConfigurationsApi
 from qaseio.api.shared_steps_api import SharedStepsApi
 
-from qaseio.models import TestCasebulk, SuiteCreate, MilestoneCreate, CustomFieldCreate, CustomFieldCreateValueInner, ProjectCreate, RunCreate, ResultcreateBulk, ConfigurationCreate, ConfigurationGroupCreate, SharedStepCreate, SharedStepContentCreate
+from qaseio.models import Attachmentupload, TestCasebulk, SuiteCreate, MilestoneCreate, CustomFieldCreate, CustomFieldCreateValueInner, ProjectCreate, RunCreate, ResultcreateBulk, ConfigurationCreate, ConfigurationGroupCreate, SharedStepCreate, SharedStepContentCreate
 
 from datetime import datetime
 
@@ -26,6 +29,11 @@ from qaseio.exceptions import ApiException
 
 
 class QaseService:
+    # Throttled (429) and unavailable (503) responses were not processed and are retried. A gateway error
+    # (502, 504) may come after a create was applied, so it is retried only for reads (_read). 500 never is
+    RETRY_STATUSES = (429, 503)
+    READ_RETRY_STATUSES = (429, 502, 503, 504)
+
     def __init__(self, config: ConfigManager, logger: Logger):
         self.config = config
         self.logger = logger
@@ -43,13 +51,59 @@ class QaseService:
         configuration.host = f'{ssl}api{delimiter}{config.get("qase.host")}/v1'
         configuration.ssl_ca_cert = certifi.where()
 
+        # Bulk payloads (cases, results) and responses of the generated client go through the fast JSON codec
+        json_codec.install(rest, api_client)
+        self.logger.log(f'Using {json_codec.name} JSON codec')
+
         self.client = ApiClient(configuration)
 
+        self.retry = RetryPolicy(max_retries=5, base=1)
+        self.breaker = self.retry.breaker(urlparse(configuration.host).netloc)
+        # Rate controller of the pool running Qase calls (AdaptiveRate). Told about every call outcome
+        self.limiter = None
+        # Pool running Qase calls (ThrottledThreadPoolExecutor). Retries take its tokens and wait without its slots
+        self.pool = None
+
+    def _sleep(self, seconds: float) -> None:
+        if self.pool is not None:
+            self.pool.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _call(self, fn, *args, **kwargs):
+        return self._retry(self.RETRY_STATUSES, fn, *args, **kwargs)
+
+    def _read(self, fn, *args, **kwargs):
+        return self._retry(self.READ_RETRY_STATUSES, fn, *args, **kwargs)
+
+    def _retry(self, statuses: tuple, fn, *args, **kwargs):
+        delay = 0
+        for attempt in range(self.retry.max_retries + 1):
+            if attempt and self.pool is not None:
+                self.pool.wait_retry(delay, current_budget())
+            elif attempt:
+                time.sleep(delay)
+            self.breaker.wait(self._sleep)
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+                self.breaker.success()
+                if self.limiter:
+                    self.limiter.success(time.monotonic() - started, current_budget())
+                return result
+            except ApiException as e:
+                if e.status == 429 and self.limiter:
+                    self.limiter.throttled()
+                if e.status not in statuses or attempt == self.retry.max_retries:
+                    raise
+                delay = self.retry.backoff(self.breaker, delay, (e.headers or {}).get('Retry-After'))
+                self.logger.log(f'Qase API responded with {e.status}, retrying in {delay:.1f}s', 'warning')
+
     def _get_users(self, limit=100, offset=0):
         try:
             api_instance = AuthorsApi(self.client)
             # Get all authors.
-            api_response = api_instance.get_authors(limit=limit, offset=offset, type="user")
+            api_response = self._read(api_instance.get_authors, limit=limit, offset=offset, type="user")
             if api_response.status and api_response.result.entities:
                 return api_response.result.entities
         except ApiException as e:
@@ -64,22 +118,24 @@ class QaseService:
             if len(result) < limit:
                 break
 
+    @operation(priority=HIGH, budget='metadata')
     def get_case_custom_fields(self):
         self.logger.log('Getting custom fields from Qase')
         try:
             api_instance = CustomFieldsApi(self.client)
             # Get all custom fields.
-            api_response = api_instance.get_custom_fields(entity='case', limit=100)
+            api_response = self._read(api_instance.get_custom_fields, entity='case', limit=100)
             if api_response.status and api_response.result.entities:
                 return api_response.result.entities
         except ApiException as e:
             self.logger.log("Exception when calling CustomFieldsApi->get_custom_fields: %s\n" % e)
 
+    @operation(priority=HIGH, budget='metadata')
     def create_custom_field(self, data) -> int:
         try:
             api_instance = CustomFieldsApi(self.client)
             # Create a custom field.
-            api_response = api_instance.create_custom_field(custom_field_create=CustomFieldCreate(**data))
+            api_response = self._call(api_instance.create_custom_field, custom_field_create=CustomFieldCreate(**data))
             if not api_response.status:
                 self.logger.log('Error creating custom field: ' + data['title'])
             else:
@@ -89,11 +145,12 @@ class QaseService:
             self.logger.log('Exception when calling CustomFieldsApi->create_custom_field: %s\n' % e)
         return 0
 
+    @operation(priority=HIGH, budget='metadata')
     def create_configuration_group(self, project_code, title):
         try:
             api_instance = ConfigurationsApi(self.client)
             # Create a custom field.
-            api_response = api_instance.create_configuration_group(
+            api_response = self._call(api_instance.create_configuration_group,
                 code=project_code,
                 configuration_group_create=ConfigurationGroupCreate(title=title)
             )
@@ -106,11 +163,12 @@ class QaseService:
             self.logger.log('Exception when calling CustomFieldsApi->create_configuration_group: %s\n' % e)
         return 0
 
+    @operation(priority=HIGH, budget='metadata')
     def create_configuration(self, project_code, title, group_id):
         try:
             api_instance = ConfigurationsApi(self.client)
             # Create a custom field.
-            api_response = api_instance.create_configuration(
+            api_response = self._call(api_instance.create_configuration,
                 code=project_code,
                 configuration_create=ConfigurationCreate(title=title, group_id=group_id)
             )
@@ -123,11 +181,12 @@ class QaseService:
             self.logger.log('Exception when calling CustomFieldsApi->create_configuration: %s\n' % e)
         return 0
 
+    @operation(priority=HIGH, budget='metadata')
     def get_system_fields(self):
         try:
             api_instance = SystemFieldsApi(self.client)
             # Get all system fields.
-            api_response = api_instance.get_system_fields()
+            api_response = self._read(api_instance.get_system_fields)
             if api_response.status and api_response.result:
                 return api_response.result
         except ApiException as e:
@@ -192,16 +251,18 @@ class QaseService:
             result[key] = value
         return result
 
+    @operation(priority=HIGH, budget='metadata')
     def get_projects(self, limit=100, offset=0):
         try:
             api_instance = ProjectsApi(self.client)
             # Get all projects.
-            api_response = api_instance.get_projects(limit, offset)
+            api_response = self._read(api_instance.get_projects, limit, offset)
             if api_response.status and api_response.result:
                 return api_response.result
         except ApiException as e:
             self.logger.log("Exception when calling ProjectsApi->get_projects: %s\n" % e)
 
+    @operation(priority=HIGH, budget='metadata')
     def create_project(self, title, description, code, group_id=None):
         api_instance = ProjectsApi(self.client)
 
@@ -221,13 +282,13 @@ class QaseService:
 
         self.logger.log(f'Creating project: {title} [{code}]')
         try:
-            api_response = api_instance.create_project(
+            api_response = self._call(api_instance.create_project,
                 project_create=ProjectCreate(**data)
             )
             self.logger.log(f'Project was created: {api_response.result.code}')
             return True
         except ApiException as e:
-            error = json.loads(e.body)
+            error = json_codec.loads(e.body)
             if error['status'] is False and error['errorFields'][0]['error'] == 'Project with the same code already exists.':
                 self.logger.log(f'Project with the same code already exists: {code}. Using existing project.')
                 return True
@@ -235,9 +296,10 @@ class QaseService:
             self.logger.log('Exception when calling ProjectsApi->create_project: %s\n' % e)
             return False
 
+    @operation(priority=HIGH, budget='metadata')
     def create_suite(self, code: str, title: str, description: str, parent_id=None) -> int:
         api_instance = SuitesApi(self.client)
-        api_response = api_instance.create_suite(
+        api_response = self._call(api_instance.create_suite,
             code=code,
             suite_create=SuiteCreate(
                 title=title,
@@ -249,17 +311,19 @@ class QaseService:
         )
         return api_response.result.id
 
+    @operation(priority=NORMAL, budget='cases')
     def create_cases(self, code: str, cases: list) -> bool:
         api_instance = CasesApi(self.client)
 
         try:
             # Create a new test cases.
-            api_response = api_instance.bulk(code, TestCasebulk(cases=cases))
+            api_response = self._call(api_instance.bulk, code, TestCasebulk(cases=cases))
             return api_response.status
         except ApiException as e:
             self.logger.log("Exception when calling CasesApi->bulk: %s\n" % e)
         return False
 
+    @operation(priority=NORMAL, budget='runs')
     def create_run(self, run: list, project_code: str, cases: list = [], milestone_id = None):
         api_instance = RunsApi(self.client)
 
@@ -289,11 +353,12 @@ class QaseService:
             data['cases'] = cases
 
         try:
-            response = api_instance.create_run(code=project_code, run_create=RunCreate(**data))
+            response = self._call(api_instance.create_run, code=project_code, run_create=RunCreate(**data))
             return response.result.id
         except Exception as e:
             self.logger.log(f'Exception when calling RunsApi->create_run: {e}')
 
+    @operation(priority=LOW, budget='results')
     def send_bulk_results(self, tr_run, results, qase_run_id, qase_code, mappings, cases_map):
         res = []
 
@@ -350,7 +415,7 @@ class QaseService:
             if len(res) > 0:
                 api_results = ResultsApi(self.client)
                 self.logger.log(f'Sending {len(res)} results to Qase')
-                api_results.create_result_bulk(
+                self._call(api_results.create_result_bulk,
                         code=qase_code,
                         id=int(qase_run_id),
                         resultcreate_bulk=ResultcreateBulk(
@@ -399,19 +464,80 @@ class QaseService:
 
         return total_seconds
 
+    @operation(priority=NORMAL, budget='attachments')
     def upload_attachment(self, code, attachment_data):
+        attachments = self.upload_attachments(code, [attachment_data])
+        if attachments:
+            return attachments[0]
+        return None
+
+    # Uploads several files in one request. Returned attachments are in the same order as the files
+    @operation(priority=NORMAL, budget='attachments')
+    def upload_attachments(self, code, attachments: list) -> list:
+        if attachments and isinstance(attachments[0], AttachmentFile):
+            return self._stream_attachments(code, attachments)
+
         api_attachments = AttachmentsApi(self.client)
         try:
-            response = api_attachments.upload_attachment(
-                    code, file=[attachment_data],
+            response = self._call(api_attachments.upload_attachment,
+                    code, file=attachments,
                 )
 
             if response.status:
-                return response.result[0].to_dict()
+                return self._check_uploaded(attachments, [item.to_dict() for item in response.result])
         except Exception as e:
             self.logger.log(f'Exception when calling AttachmentsApi->upload_attachment: {e}')
-        return None
+        return []
+
+    def _stream_attachments(self, code, attachments: list) -> list:
+        # The generated client reads files into memory to build the request body,
+        # so spooled attachments are sent through its connection pool as a streamed multipart body instead
+        def send():
+            # The body is read while sending, so every attempt gets a new one
+            body = MultipartStream('file', attachments)
+            response = self.client.rest_client.pool_manager.urlopen(
+                'POST',
+                f'{self.client.configuration.host}/attachment/{code}',
+                body=body,
+                headers={
+                    'Token': self.client.configuration.api_key['TokenAuth'],
+                    'Accept': 'application/json',
+                    'Content-Type': body.content_type,
+                    'Content-Length': str(len(body)),
+                },
+                retries=False,
+            )
+            if response.status >= 400:
+                e = ApiException(status=response.status, reason=response.reason, body=response.data.decode('utf-8', 'replace'))
+                e.headers = response.headers
+                raise e
+            return response
 
+        try:
+            response = self._call(send)
+            data = json_codec.loads(response.data)
+            if data['status']:
+                return self._check_uploaded(attachments, [Attachmentupload.from_dict(item).to_dict() for item in data['result']])
+        except Exception as e:
+            self.logger.log(f'Exception when calling AttachmentsApi->upload_attachment (stream): {e}')
+        return []
+
+    # Uploaded attachments are matched to the files by position. A batch is only trusted when every position
+    # has the file's name, otherwise it is uploaded again file by file (a single file can not be mismatched)
+    def _check_uploaded(self, attachments: list, uploaded: list) -> list:
+        if len(uploaded) != len(attachments):
+            self.logger.log(f'Uploaded {len(uploaded)} attachments instead of {len(attachments)}, results can not be matched', 'error')
+            return []
+        for attachment, item in zip(attachments, uploaded):
+            name = getattr(attachment, 'name', None)
+            if name is not None and item.get('filename') not in (name, MultipartStream.filename(name)):
+                if len(attachments) > 1:
+                    self.logger.log(f'Uploaded attachment {item.get("filename")} does not match {name}, results can not be matched', 'error')
+                    return []
+                self.logger.log(f'Attachment {name} was uploaded as {item.get("filename")}', 'warning')
+        return uploaded
+
+    @operation(priority=HIGH, budget='metadata')
     def create_milestone(self, project_code, title, description, status, due_date):
         data = {
             'project_code': project_code,
@@ -425,12 +551,13 @@ class QaseService:
             data['due_date'] = due_date
 
         api_instance = MilestonesApi(self.client)
-        api_response = api_instance.create_milestone(
+        api_response = self._call(api_instance.create_milestone,
             code=project_code,
             milestone_create=MilestoneCreate(**data)
         )
         return api_response.result.id
 
+    @operation(priority=HIGH, budget='metadata')
     def create_shared_step(self, project_code, title, steps):
         inner_steps = []
 
@@ -447,5 +574,5 @@ class QaseService:
             )
 
         api_instance = SharedStepsApi(self.client)
-        api_response = api_instance.create_shared_step(project_code, SharedStepCreate(title=title, steps=inner_steps))
+        api_response = self._call(api_instance.create_shared_step, project_code, SharedStepCreate(title=title, steps=inner_steps))
         return api_response.result.hash
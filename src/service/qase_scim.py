@@ -14,9 +14,13 @@ class QaseScimService:
         self.client = QaseScimClient(
             base_url=self.config.get('qase.host'), 
             token=self.config.get('qase.scim_token'), 
-            ssl=bool(self.config.get('qase.ssl'))
+            ssl=bool(self.config.get('qase.ssl')),
+            pool_size=self.config.get('qase.scim_pool_size') or 10
         )
 
+    def get_connection_stats(self) -> dict:
+        return self.client.connection_stats()
+
     def create_user(self, email, first_name, last_name, roleTitle, is_active=True):
         try:
             payload = {
@@ -1,10 +1,38 @@
-from ..repository.testrail import TestrailApiRepository, TestrailDbRepository
+import copy
+import os
+
+from ..support import ResponseCache, SingleFlight, Memo
+from ..repository.testrail import TestrailApiRepository, TestrailDbRepository, TestrailAsyncApiRepository
 from ..api.testrail import TestrailApiClient
+from ..api.testrail_async import TestrailAsyncApiClient
+
+
+# Endpoints cached by default when testrail.cache.mode is set. The data they return does not change
+# for finished projects, so re-runs can read it from disk
+CACHED_ENDPOINTS = (
+    'get_suites', 'get_sections', 'get_cases', 'get_runs', 'get_plans', 'get_plan',
+    'get_tests', 'get_test', 'get_results_for_run', 'get_milestones', 'get_shared_steps', 'get_attachments_for_case',
+)
+
+# Small index reads kept in memory for a short time. Several importers ask for them
+# (suites by suites and cases, fields and statuses by fields, cases and runs)
+MEMOIZED = (
+    'get_suites', 'get_configurations', 'get_case_fields', 'get_case_types', 'get_case_statuses',
+    'get_result_statuses', 'get_priorities',
+)
 
 
 class TestrailService:
-    def __init__(self, config, logger):
+    # workers is the number of threads that read from TestRail at the same time, it sizes the connection pool
+    def __init__(self, config, logger, workers: int = 1):
         self.db_repository = None
+        self.cache = self._get_cache(config)
+        # Identical concurrent reads share one request, recent results are served from memory
+        # Results are copied for each caller, so one caller changing a list does not change it for the others
+        self.flight = SingleFlight(copy = copy.deepcopy)
+        memo_ttl = config.get('testrail.memo_ttl')
+        self.memo = Memo(ttl = 300 if memo_ttl is None else memo_ttl, copy = copy.deepcopy)
+        attachments_workers = config.get('attachments.list_workers') or 24
         self.api_repository = TestrailApiRepository(
             TestrailApiClient(
                 base_url = config.get('testrail.api.host'),
@@ -12,11 +40,18 @@ class TestrailService:
                 token = config.get('testrail.api.password'),
                 logger = logger,
                 max_retries = 5,
-                backoff_factor = 5
+                backoff_factor = 5,
+                attachments_page_size = config.get('attachments.page_size') or 250,
+                attachments_workers = attachments_workers,
+                # One connection per thread: the workers, or the attachment listing, whichever is more
+                pool_size = config.get('testrail.api.pool_size') or max(workers, attachments_workers),
+                cache = self.cache,
             )
         )
 
         self.logger = logger
+        if self.cache:
+            self.logger.log(f'Using TestRail response cache: {self.cache.path} ({self.cache.mode})')
 
         if config.get('testrail_db_host'):
             self.db_repository = TestrailDbRepository(host=config.get('testrail.db.host'),
@@ -31,76 +66,222 @@ class TestrailService:
         else:
             self.logger.log('Using TestRail API repository')
             self.repository = self.api_repository
+
+        # Native async reads. Pools.tr awaits methods of `aio` instead of running the blocking ones in threads
+        self.aio = None
+        if not self.db_repository and config.get('testrail.api.async'):
+            try:
+                self.aio = TestrailAsyncService(
+                    TestrailAsyncApiRepository(
+                        TestrailAsyncApiClient(
+                            base_url = config.get('testrail.api.host'),
+                            user = config.get('testrail.api.user'),
+                            token = config.get('testrail.api.password'),
+                            logger = logger,
+                            max_retries = 5,
+                            backoff_factor = 5,
+                            concurrency = config.get('testrail.api.concurrency') or 100,
+                            cache = self.cache,
+                        )
+                    ),
+                    logger,
+                    self.flight,
+                    self.memo
+                )
+                self.logger.log('Using async TestRail API client')
+            except ImportError as e:
+                self.logger.log(f'Async TestRail API client is not available: {e}', 'warning')
     
+    @staticmethod
+    def _get_cache(config):
+        mode = config.get('testrail.cache.mode')
+        if not mode or mode == 'off':
+            return None
+
+        ttls = dict.fromkeys(CACHED_ENDPOINTS)
+        ttls.update(config.get('testrail.cache.ttls') or {})
+        ttl = config.get('testrail.cache.ttl')
+        return ResponseCache(
+            path = os.path.join('./cache', str(config.get('prefix') or 'default'), 'testrail'),
+            mode = mode,
+            ttl = 86400 if ttl is None else ttl,
+            ttls = ttls,
+            namespace = str(config.get('testrail.api.host')),
+        )
+
+    def get_cache_stats(self):
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def _read(self, name: str, fn, *args):
+        key = (name,) + args
+        if (result := self.memo.get(key)) is not Memo.MISS:
+            return result
+        result = self.flight.call(key, fn, *args)
+        if name in MEMOIZED:
+            self.memo.set(key, result)
+        return result
+
+    def get_connection_stats(self) -> dict:
+        return self.api_repository.client.connection_stats()
+
     def get_users(self, limit: int = 250, offset: int = 0):
-        return self.repository.get_users(limit, offset)
+        return self._read('get_users', self.repository.get_users, limit, offset)
     
     def get_groups(self, limit: int = 250, offset: int = 0):
-        return self.repository.get_groups(limit, offset)
+        return self._read('get_groups', self.repository.get_groups, limit, offset)
     
     def get_case_types(self):
-        return self.repository.get_case_types()
+        return self._read('get_case_types', self.repository.get_case_types)
     
     def get_result_statuses(self):
-        return self.repository.get_result_statuses()
+        return self._read('get_result_statuses', self.repository.get_result_statuses)
     
     def get_case_statuses(self):
-        return self.repository.get_case_statuses()
+        return self._read('get_case_statuses', self.repository.get_case_statuses)
     
     def get_priorities(self):
-        return self.repository.get_priorities()
+        return self._read('get_priorities', self.repository.get_priorities)
     
     def get_configurations(self, project_id: int):
-        return self.repository.get_configurations(project_id)
+        return self._read('get_configurations', self.repository.get_configurations, project_id)
     
     def get_case_fields(self):
-        return self.repository.get_case_fields()
+        return self._read('get_case_fields', self.repository.get_case_fields)
     
     def get_shared_steps(self, project_id: int, limit: int = 250, offset: int = 0):
-        return self.repository.get_shared_steps(project_id, limit, offset)
+        return self._read('get_shared_steps', self.repository.get_shared_steps, project_id, limit, offset)
     
     def get_projects(self, limit: int = 250, offset: int = 0):
-        return self.repository.get_projects(limit, offset)
+        return self._read('get_projects', self.repository.get_projects, limit, offset)
     
     def get_suites(self, project_id):
-        return self.repository.get_suites(project_id)
+        return self._read('get_suites', self.repository.get_suites, project_id)
     
     def get_sections(self, project_id: int, limit: int = 100, offset: int = 0, suite_id: int = 0):
-        return self.repository.get_sections(project_id, limit, offset, suite_id)['sections']
+        return self._read('get_sections', self.repository.get_sections, project_id, limit, offset, suite_id)['sections']
     
     def get_cases(self, project_id: int, suite_id: int = 0, limit: int = 250, offset: int = 0):
-        return self.repository.get_cases(project_id, suite_id, limit, offset)
+        return self._read('get_cases', self.repository.get_cases, project_id, suite_id, limit, offset)
     
     def get_runs(self, project_id: int, suite_id: int = 0, created_after: int = 0, limit: int = 250, offset: int = 0):
-        return self.repository.get_runs(project_id, suite_id, created_after, limit, offset)
+        return self._read('get_runs', self.repository.get_runs, project_id, suite_id, created_after, limit, offset)
 
     def get_results(self, run_id: int, limit: int = 250, offset: int = 0):
-        return self.repository.get_results(run_id, limit, offset)
+        return self._read('get_results', self.repository.get_results, run_id, limit, offset)
     
-    def get_attachment(self, attachment_id: int):
-        return self.api_repository.get_attachment(attachment_id)
+    def get_attachment(self, attachment_id: int, stream: bool = False):
+        return self.api_repository.get_attachment(attachment_id, stream)
     
     def get_attachments_list(self):
         return self.api_repository.get_attachments_list()
     
     def get_attachments_case(self, case_id: int):
-        return self.repository.get_attachments_case(case_id)
+        return self._read('get_attachments_case', self.repository.get_attachments_case, case_id)
     
     def get_test(self, test_id: int):
-        return self.repository.get_test(test_id)
+        return self._read('get_test', self.repository.get_test, test_id)
     
     def get_tests(self, run_id: int, limit: int = 250, offset: int = 0):
-        return self.repository.get_tests(run_id, limit, offset)
+        return self._read('get_tests', self.repository.get_tests, run_id, limit, offset)
     
     def get_plans(self, project_id: int, limit: int = 250, offset: int = 0):
-        return self.repository.get_plans(project_id, limit, offset)
+        return self._read('get_plans', self.repository.get_plans, project_id, limit, offset)
     
     def get_plan(self, plan_id: int):
         try:
-            return self.repository.get_plan(plan_id)
+            return self._read('get_plan', self.repository.get_plan, plan_id)
         except Exception as e:
             self.logger.log(f'[TestRail] Failed to get plan {plan_id}: {e}')
             return None
     
     def get_milestones(self, project_id: int, limit: int = 250, offset: int = 0):
-        return self.repository.get_milestones(project_id, limit, offset)
\ No newline at end of file
+        return self._read('get_milestones', self.repository.get_milestones, project_id, limit, offset)
+
+
+class TestrailAsyncService:
+    def __init__(self, repository: TestrailAsyncApiRepository, logger, flight: SingleFlight = None, memo: Memo = None):
+        self.repository = repository
+        self.logger = logger
+        self.flight = flight if flight is not None else SingleFlight(copy=copy.deepcopy)
+        self.memo = memo if memo is not None else Memo(copy=copy.deepcopy)
+
+    async def _read(self, name: str, fn, *args):
+        key = (name,) + args
+        if (result := self.memo.get(key)) is not Memo.MISS:
+            return result
+        result = await self.flight.do(key, fn, *args)
+        if name in MEMOIZED:
+            self.memo.set(key, result)
+        return result
+
+    def close(self):
+        self.repository.client.close()
+
+    async def get_users(self, limit: int = 250, offset: int = 0):
+        return await self._read('get_users', self.repository.get_users, limit, offset)
+
+    async def get_groups(self, limit: int = 250, offset: int = 0):
+        return await self._read('get_groups', self.repository.get_groups, limit, offset)
+
+    async def get_case_types(self):
+        return await self._read('get_case_types', self.repository.get_case_types)
+
+    async def get_result_statuses(self):
+        return await self._read('get_result_statuses', self.repository.get_result_statuses)
+
+    async def get_case_statuses(self):
+        return await self._read('get_case_statuses', self.repository.get_case_statuses)
+
+    async def get_priorities(self):
+        return await self._read('get_priorities', self.repository.get_priorities)
+
+    async def get_configurations(self, project_id: int):
+        return await self._read('get_configurations', self.repository.get_configurations, project_id)
+
+    async def get_case_fields(self):
+        return await self._read('get_case_fields', self.repository.get_case_fields)
+
+    async def get_shared_steps(self, project_id: int, limit: int = 250, offset: int = 0):
+        return await self._read('get_shared_steps', self.repository.get_shared_steps, project_id, limit, offset)
+
+    async def get_projects(self, limit: int = 250, offset: int = 0):
+        return await self._read('get_projects', self.repository.get_projects, limit, offset)
+
+    async def get_suites(self, project_id):
+        return await self._read('get_suites', self.repository.get_suites, project_id)
+
+    async def get_sections(self, project_id: int, limit: int = 100, offset: int = 0, suite_id: int = 0):
+        return (await self._read('get_sections', self.repository.get_sections, project_id, limit, offset, suite_id))['sections']
+
+    async def get_cases(self, project_id: int, suite_id: int = 0, limit: int = 250, offset: int = 0):
+        return await self._read('get_cases', self.repository.get_cases, project_id, suite_id, limit, offset)
+
+    async def get_runs(self, project_id: int, suite_id: int = 0, created_after: int = 0, limit: int = 250, offset: int = 0):
+        return await self._read('get_runs', self.repository.get_runs, project_id, suite_id, created_after, limit, offset)
+
+    async def get_results(self, run_id: int, limit: int = 250, offset: int = 0):
+        return await self._read('get_results', self.repository.get_results, run_id, limit, offset)
+
+    async def get_attachments_case(self, case_id: int):
+        return await self._read('get_attachments_case', self.repository.get_attachments_case, case_id)
+
+    async def get_test(self, test_id: int):
+        return await self._read('get_test', self.repository.get_test, test_id)
+
+    async def get_tests(self, run_id: int, limit: int = 250, offset: int = 0):
+        return await self._read('get_tests', self.repository.get_tests, run_id, limit, offset)
+
+    async def get_plans(self, project_id: int, limit: int = 250, offset: int = 0):
+        return await self._read('get_plans', self.repository.get_plans, project_id, limit, offset)
+
+    async def get_plan(self, plan_id: int):
+        try:
+            return await self._read('get_plan', self.repository.get_plan, plan_id)
+        except Exception as e:
+            self.logger.log(f'[TestRail] Failed to get plan {plan_id}: {e}')
+            return None
+
+    async def get_milestones(self, project_id: int, limit: int = 250, offset: int = 0):
+        return await self._read('get_milestones', self.repository.get_milestones, project_id, limit, offset)
@@ -3,13 +3,36 @@ from .logger import Logger
 from .mappings import Mappings
 from .stats import Stats
 from .pools import Pools
+from .task_window import TaskWindow
 from .throttled_pool import ThrottledThreadPoolExecutor
+from .token_bucket import TokenBucket
+from .shared_bucket import SqliteTokenBucket
+from .adaptive_rate import AdaptiveRate
+from .operations import operation
+from .streams import AttachmentFile, MultipartStream
+from .attachments_cache import AttachmentsCache
+from .single_flight import SingleFlight, Memo
+from .retry import RetryPolicy, CircuitBreaker
+from .response_cache import ResponseCache
 
 __all__ = [
     "Pools",
+    "TaskWindow",
     "ConfigManager",
     "Logger",
     "Mappings",
     "Stats",
     "ThrottledThreadPoolExecutor",
+    "TokenBucket",
+    "SqliteTokenBucket",
+    "AdaptiveRate",
+    "operation",
+    "AttachmentFile",
+    "MultipartStream",
+    "AttachmentsCache",
+    "SingleFlight",
+    "Memo",
+    "RetryPolicy",
+    "CircuitBreaker",
+    "ResponseCache",
 ]
\ No newline at end of file
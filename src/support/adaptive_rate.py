@@ -0,0 +1,101 @@
+import threading
+import time
+
+from .logger import Logger
+from .token_bucket import TokenBucket
+
+
+class AdaptiveRate:
+    # AIMD control of a token bucket rate. Every successful call adds about `step` requests per second
+    # per second of traffic, a throttled call (429) or latency rising above `latency_factor` times the usual
+    # latency multiplies the rate by `decrease`. Decreases are spaced by `cooldown` seconds, so one burst of
+    # throttled calls already in flight counts once.
+    # Latency is compared within an operation family (the @operation budget): an upload or a bulk of results
+    # is only slow next to other uploads or bulks, not next to small creates. Families in `sized` carry payloads
+    # of any size (attachments, bulks of results), their latency says nothing about the server and only 429 counts.
+    def __init__(self, bucket: TokenBucket, logger: Logger = None, min_rate: float = 1.0, max_rate: float = None,
+                 step: float = 0.5, decrease: float = 0.5, latency_factor: float = 3.0, cooldown: float = 2.0,
+                 sized: tuple = ('attachments', 'results')):
+        self.bucket = bucket
+        self.logger = logger
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else bucket.rate * 2
+        self.step = step
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.sized = sized
+
+        # family -> [fast moving average, slow moving average] of latency
+        self.latencies = {}
+        self.decreased_at = 0.0
+        self.logged_rate = bucket.rate
+        self.lowest = bucket.rate
+        self.highest = bucket.rate
+        self.decreases = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def success(self, latency: float, family: str = None) -> None:
+        with self._lock:
+            if family in self.sized:
+                self._increase()
+                return
+            averages = self.latencies.get(family)
+            if averages is None:
+                averages = self.latencies[family] = [latency, latency]
+            # Fast and slow moving averages. The slow one is the usual latency the fast one is compared with
+            averages[0] = averages[0] * 0.8 + latency * 0.2
+            averages[1] = averages[1] * 0.99 + latency * 0.01
+            if averages[0] > averages[1] * self.latency_factor:
+                name = f'{family} ' if family else ''
+                self._decrease(f'{name}latency {averages[0]:.2f}s, usual {averages[1]:.2f}s')
+                return
+            self._increase()
+
+    def _increase(self) -> None:
+        self._set(min(self.max_rate, self.rate + self.step / max(self.rate, 1.0)))
+
+    def throttled(self, reason: str = '429') -> None:
+        with self._lock:
+            self._decrease(reason)
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self.decreased_at < self.cooldown:
+            return
+        self.decreased_at = now
+        self.decreases += 1
+        self._set(max(self.min_rate, self.rate * self.decrease), reason)
+
+    def _set(self, rate: float, reason: str = None) -> None:
+        self.bucket.set_rate(rate)
+        self.lowest = min(self.lowest, rate)
+        self.highest = max(self.highest, rate)
+        # Logged on every decrease and on increases of 10% since the last logged rate
+        if self.logger and (reason or rate >= self.logged_rate * 1.1):
+            suffix = f' ({reason})' if reason else ''
+            self.logger.log(f'[Qase] Rate limit set to {rate:.2f} req/s{suffix}', 'warning' if reason else 'info')
+            self.logged_rate = rate
+
+    @staticmethod
+    def merge_stats(stats: list) -> dict:
+        # Combines stats() of limiters in several processes
+        return {
+            'rate': stats[-1]['rate'],
+            'lowest_rate': min(item['lowest_rate'] for item in stats),
+            'highest_rate': max(item['highest_rate'] for item in stats),
+            'decreases': sum(item['decreases'] for item in stats),
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rate': round(self.rate, 2),
+                'lowest_rate': round(self.lowest, 2),
+                'highest_rate': round(self.highest, 2),
+                'decreases': self.decreases,
+            }
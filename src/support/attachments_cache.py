@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+from typing import Optional
+
+
+class AttachmentsCache:
+    # Append-only JSON lines store of uploaded attachments keyed by TestRail attachment id and Qase project code.
+    # Every successful upload is written immediately, so a restarted migration can skip what was already moved.
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(self.path, 'a')
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line can be incomplete if the previous run was killed while writing it
+                    continue
+                self.entries[(entry['id'], entry['code'])] = entry
+
+    def get(self, attachment_id: str, code: str) -> Optional[dict]:
+        entry = self.entries.get((attachment_id, code))
+        if entry:
+            return entry['attachment']
+        return None
+
+    def add(self, attachment_id: str, code: str, attachment: dict, digest: Optional[str] = None) -> None:
+        entry = {
+            'id': attachment_id,
+            'code': code,
+            'digest': digest,
+            'attachment': attachment,
+        }
+        with self._lock:
+            self.entries[(attachment_id, code)] = entry
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+
+    def digests(self) -> dict:
+        result = {}
+        for entry in list(self.entries.values()):
+            if entry['digest']:
+                result.setdefault(entry['code'], {})[entry['digest']] = entry['attachment']
+        return result
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __getstate__(self):
+        # A process the cache is sent to appends to the same file through its own handle
+        state = self.__dict__.copy()
+        del state['_lock'], state['_file']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a')
@@ -1,4 +1,5 @@
 from .stats import Stats
+from .single_flight import SingleFlight
 
 
 class Mappings:
@@ -14,6 +15,14 @@ class Mappings:
         self.configurations = {}
         self.projects = []
         self.attachments_map = {}
+        # A map of Qase project codes to content SHA-256 digests of uploaded attachments. Used for deduplication
+        self.attachments_digests = {}
+        # Persistent store of uploaded attachments. Set when cache is enabled
+        self.attachments_cache = None
+        # Ids of TestRail attachments referenced by migrated cases, suites and results
+        self.attachments_refs = set()
+        # Attachment transfers in flight, so each missing attachment is uploaded only once
+        self.attachments_flight = SingleFlight()
         self.shared_steps = {}
 
         # A map of TestRail project ids to Qase project codes
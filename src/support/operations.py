@@ -0,0 +1,36 @@
+import functools
+import threading
+
+# Scheduling classes of service operations. Pools read them from the called method
+# and pass them to the pool that runs it.
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+_running = threading.local()
+
+
+def operation(priority: int = NORMAL, budget: str = None):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            # The budget of the running operation is available to the calls it makes, see current_budget()
+            previous = getattr(_running, 'budget', None)
+            _running.budget = budget
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _running.budget = previous
+
+        wrapper.priority = priority
+        wrapper.budget = budget
+        return wrapper
+
+    return decorator
+
+
+def current_budget():
+    # Budget of the @operation running in this thread, None outside of one
+    return getattr(_running, 'budget', None)
@@ -1,56 +1,173 @@
-import functools
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
 import asyncio
 
+from .operations import NORMAL
+from .task_window import TaskWindow
+
 
 class Pools:
     def __init__(
             self,
             qase_pool: ThreadPoolExecutor,
             tr_pool: ThreadPoolExecutor,
+            large_pool: ThreadPoolExecutor = None,
+            read_ahead: int = 2,
+            window: int = 2,
     ):
         self.qase_pool = qase_pool
         self.tr_pool = tr_pool
+        # Dedicated lane for large transfers, so they do not hold every TestRail and Qase worker
+        self.large_pool = large_pool if large_pool is not None else tr_pool
+        # Items a paginated generator reads ahead of its consumer
+        self.read_ahead = read_ahead
+        # Tasks per worker an importer keeps in flight, see window()
+        self.window_factor = window
 
     @staticmethod
-    async def async_gen(pool: ThreadPoolExecutor, fn, *args, **kwargs):
-        def gen_next(gen):
+    async def async_gen(pool: ThreadPoolExecutor, fn, *args, read_ahead: int = 2, **kwargs):
+        # Runs the generator on one worker, which reads up to `read_ahead` items ahead of the consumer.
+        # On a throttled pool every item after the first one also takes a token, as if it was its own task
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        space = threading.Semaphore(read_ahead)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
             try:
-                return next(gen)
-            except StopIteration:
-                pass
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # The event loop is closed, nobody is consuming anymore
+                stop.set()
 
-        gen = await asyncio.wrap_future(pool.submit(fn, *args, **kwargs))
-        while True:
-            if (i := await asyncio.wrap_future(pool.submit(gen_next, gen))) is None:
-                break
-            yield i
+        def produce():
+            gen = fn(*args, **kwargs)
+            try:
+                # The first item is read with the token taken by the task itself
+                while (item := next(gen, done)) is not done:
+                    space.acquire()
+                    if stop.is_set():
+                        break
+                    put(item)
+                    if hasattr(pool, 'acquire'):
+                        pool.acquire()
+            except BaseException as e:
+                put(_Failure(e))
+            finally:
+                gen.close()
+                put(done)
+
+        pool.submit(produce)
+        try:
+            while True:
+                item = await queue.get()
+                space.release()
+                if item is done:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.exception
+                # A None item ends the stream, like an exhausted generator
+                if item is None:
+                    break
+                yield item
+        finally:
+            # Unblocks a producer waiting for space, it stops before reading another item
+            stop.set()
+            space.release()
 
     @staticmethod
-    async def async_gen_all(pool: ThreadPoolExecutor, fn, *args, **kwargs):
-        return functools.reduce(lambda x, y: x + y, [_ async for _ in Pools.async_gen(pool, fn, *args, **kwargs)])
+    async def async_gen_all(pool: ThreadPoolExecutor, fn, *args, **kwargs) -> list:
+        items = []
+        async for page in Pools.async_gen(pool, fn, *args, **kwargs):
+            items.extend(page)
+        return items
+
+    @staticmethod
+    async def async_items(pool: ThreadPoolExecutor, fn, *args, **kwargs):
+        # Items of a paginated generator one by one, without collecting the pages
+        async for page in Pools.async_gen(pool, fn, *args, **kwargs):
+            for item in page:
+                yield item
+
+    @staticmethod
+    def native(fn):
+        # Async twin of a service method: fn.__self__.aio.<name>, when the service has a native async backend
+        aio = getattr(getattr(fn, '__self__', None), 'aio', None)
+        if aio is None:
+            return None
+        return getattr(aio, getattr(fn, '__name__', ''), None)
 
     def tr(self, fn, *args, **kwargs):
+        if (native := self.native(fn)) is not None:
+            return native(*args, **kwargs)
         return asyncio.wrap_future(self.tr_pool.submit(fn, *args, **kwargs))
 
     def qs(self, fn, *args, **kwargs):
-        return asyncio.wrap_future(self.qase_pool.submit(fn, *args, **kwargs))
+        # Service methods marked with @operation are scheduled with their priority and rate budget
+        if hasattr(self.qase_pool, 'schedule'):
+            future = self.qase_pool.schedule(
+                fn, args, kwargs,
+                priority=getattr(fn, 'priority', NORMAL),
+                budget=getattr(fn, 'budget', None),
+            )
+        else:
+            future = self.qase_pool.submit(fn, *args, **kwargs)
+        return asyncio.wrap_future(future)
+
+    def large(self, fn, *args, **kwargs):
+        return asyncio.wrap_future(self.large_pool.submit(fn, *args, **kwargs))
+
+    def large_qs(self, fn, *args, **kwargs):
+        # Qase calls made from the large lane still spend tokens of the Qase pool
+        def throttled():
+            if hasattr(self.qase_pool, 'acquire'):
+                self.qase_pool.acquire(getattr(fn, 'budget', None))
+            return fn(*args, **kwargs)
+
+        return asyncio.wrap_future(self.large_pool.submit(throttled))
+
+    def window(self, *pools) -> TaskWindow:
+        # Windowed TaskGroup sized from the workers of the given pools, the TestRail and Qase pools by default.
+        # A few tasks per worker keep the pools busy while later work is not started yet
+        workers = sum(
+            getattr(pool, 'workers', None) or getattr(pool, '_max_workers', 1) for pool in pools or (self.tr_pool, self.qase_pool)
+        )
+        return TaskWindow(workers * self.window_factor)
+
+    def tr_window(self) -> TaskWindow:
+        return self.window(self.tr_pool)
+
+    def qs_window(self) -> TaskWindow:
+        return self.window(self.qase_pool)
 
     async def tr_task(self, fn, *args, **kwargs):
-        return await asyncio.wrap_future(self.tr_pool.submit(fn, *args, **kwargs))
+        return await self.tr(fn, *args, **kwargs)
 
     async def qs_task(self, fn, *args, **kwargs):
-        return await asyncio.wrap_future(self.qase_pool.submit(fn, *args, **kwargs))
+        return await self.qs(fn, *args, **kwargs)
 
     def tr_gen(self, fn, *args, **kwargs):
-        return self.async_gen(self.tr_pool, fn, *args, **kwargs)
+        return self.async_gen(self.tr_pool, fn, *args, read_ahead=self.read_ahead, **kwargs)
 
     def qs_gen(self, fn, *args, **kwargs):
-        return self.async_gen(self.qase_pool, fn, *args, **kwargs)
+        return self.async_gen(self.qase_pool, fn, *args, read_ahead=self.read_ahead, **kwargs)
 
     async def tr_gen_all(self, fn, *args, **kwargs):
-        return await self.async_gen_all(self.tr_pool, fn, *args, **kwargs)
+        return await self.async_gen_all(self.tr_pool, fn, *args, read_ahead=self.read_ahead, **kwargs)
 
     async def qs_gen_all(self, fn, *args, **kwargs):
-        return await self.async_gen_all(self.qase_pool, fn, *args, **kwargs)
+        return await self.async_gen_all(self.qase_pool, fn, *args, read_ahead=self.read_ahead, **kwargs)
+
+    def tr_items(self, fn, *args, **kwargs):
+        return self.async_items(self.tr_pool, fn, *args, read_ahead=self.read_ahead, **kwargs)
+
+    def qs_items(self, fn, *args, **kwargs):
+        return self.async_items(self.qase_pool, fn, *args, read_ahead=self.read_ahead, **kwargs)
+
+
+class _Failure:
+    # Exception raised by a generator running on a worker, passed to the consumer through the queue
+    def __init__(self, exception: BaseException):
+        self.exception = exception
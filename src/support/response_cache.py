@@ -0,0 +1,93 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Optional
+
+from . import json_codec
+
+
+class ResponseCache:
+    # On-disk cache of decoded API responses, one file per URI, grouped by endpoint.
+    # Modes:
+    #   on     - serve fresh entries from disk, fetch and store the rest
+    #   record - always fetch and store, refreshing the cache
+    #   replay - serve only from disk, regardless of age. A missing entry is an error
+    MODES = ('on', 'record', 'replay')
+
+    MISS = object()
+
+    def __init__(self, path: str, mode: str = 'on', ttl: Optional[float] = 86400, ttls: Optional[dict] = None, namespace: str = ''):
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown cache mode: {mode}. Expected one of: {", ".join(self.MODES)}')
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(uri: str) -> str:
+        return uri.split('/', 1)[0].split('&', 1)[0]
+
+    def cacheable(self, uri: str) -> bool:
+        # ttl 0 disables caching for an endpoint, a negative ttl keeps its entries forever
+        return self.ttls.get(self.endpoint(uri), 0) != 0
+
+    def _ttl(self, uri: str) -> Optional[float]:
+        ttl = self.ttls.get(self.endpoint(uri))
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None or ttl < 0:
+            return None
+        return ttl
+
+    def _file(self, uri: str) -> str:
+        key = hashlib.sha1(f'{self.namespace}{uri}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, self.endpoint(uri), f'{key}.json')
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def load(self, uri: str):
+        if self.mode == 'record' or not self.cacheable(uri):
+            return self.MISS
+        file = self._file(uri)
+        try:
+            ttl = self._ttl(uri)
+            if self.mode == 'on' and ttl is not None and time.time() - os.path.getmtime(file) > ttl:
+                self._count('misses')
+                return self.MISS
+            with open(file, 'rb') as f:
+                data = json_codec.loads(f.read())
+        except (OSError, ValueError):
+            self._count('misses')
+            return self.MISS
+        self._count('hits')
+        return data
+
+    def store(self, uri: str, data) -> None:
+        if self.mode == 'replay' or not self.cacheable(uri):
+            return
+        file = self._file(uri)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        # Written next to the target and renamed, so a reader never sees a partial file
+        tmp = f'{file}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(json_codec.dumpb(data))
+        os.replace(tmp, file)
+        self._count('stores')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+            }
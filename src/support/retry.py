@@ -0,0 +1,109 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import Optional
+
+
+class CircuitBreaker:
+    # Pauses all requests to one host. Every client (thread or coroutine) waits for the breaker
+    # before sending, so a throttled host is backed off by the whole pool at once.
+    _breakers = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, host: str, threshold: int = 5, cooldown: float = 30.0, jitter: float = 1.0):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.jitter = jitter
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_host(cls, host: str, **kwargs) -> 'CircuitBreaker':
+        with cls._registry_lock:
+            if host not in cls._breakers:
+                cls._breakers[host] = cls(host, **kwargs)
+            return cls._breakers[host]
+
+    def remaining(self) -> float:
+        return max(0.0, self.open_until - time.monotonic())
+
+    def _delay(self) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            return 0.0
+        # Waiters are released spread over a short window instead of all at the same moment
+        return remaining + random.uniform(0, self.jitter)
+
+    def wait(self, sleep=time.sleep) -> float:
+        delay = self._delay()
+        if delay > 0:
+            sleep(delay)
+        return delay
+
+    async def wait_async(self) -> float:
+        delay = self._delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.open_until = max(self.open_until, time.monotonic() + seconds)
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+
+    def failure(self) -> bool:
+        # Returns True when this failure opened the breaker
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.threshold:
+                return False
+            self.failures = 0
+            self.open_until = max(self.open_until, time.monotonic() + self.cooldown)
+            return True
+
+
+class RetryPolicy:
+    # Retry delays with decorrelated jitter: each delay is random between base and three times the previous one,
+    # capped. A Retry-After sent by the server takes precedence and pauses the host's breaker for everybody.
+    def __init__(self, max_retries: int = 7, base: float = 1.0, cap: float = 60.0, threshold: int = 5, cooldown: float = 30.0):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        return CircuitBreaker.for_host(host, threshold=self.threshold, cooldown=self.cooldown)
+
+    def delay(self, previous: float = 0.0) -> float:
+        return min(self.cap, random.uniform(self.base, max(self.base, previous * 3)))
+
+    def backoff(self, breaker: CircuitBreaker, previous: float = 0.0, retry_after=None) -> float:
+        breaker.failure()
+        seconds = self.retry_after(retry_after)
+        if seconds is not None:
+            breaker.pause(seconds)
+            return seconds
+        return self.delay(previous)
+
+    @staticmethod
+    def retry_after(value) -> Optional[float]:
+        # Retry-After is either a number of seconds or an HTTP date
+        if value is None:
+            return None
+        value = str(value).strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
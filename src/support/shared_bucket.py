@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+import time
+
+
+class SqliteTokenBucket:
+    # Token bucket stored in a SQLite database, shared by all processes on the host that use the same file
+    # and name. Same interface as TokenBucket. Every change runs in an immediate transaction, so processes
+    # take tokens one after another. There is no cross-process wake up: waiters sleep until the next token is due.
+    # A bucket that already exists keeps its rate, which other processes may have adjusted, unless `reset` is set.
+    # A kept rate is lowered to `max_rate`, so a rate raised in an earlier run never goes over the configured ceiling.
+    def __init__(self, path: str, name: str, rate: float, capacity: float = None, reset: bool = False,
+                 max_rate: float = None):
+        self.path = path
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'name TEXT PRIMARY KEY, tokens REAL, updated REAL, rate REAL, capacity REAL)'
+            )
+            self._db.execute(
+                'INSERT INTO buckets (name, tokens, updated, rate, capacity) VALUES (?, ?, ?, ?, ?) ' + (
+                    'ON CONFLICT(name) DO UPDATE SET rate = excluded.rate, capacity = excluded.capacity'
+                    if reset else 'ON CONFLICT(name) DO NOTHING'
+                ),
+                (name, self.capacity, time.time(), self.rate, self.capacity)
+            )
+            if max_rate is not None:
+                self._db.execute('UPDATE buckets SET rate = MIN(rate, ?) WHERE name = ?', (max_rate, name))
+            self.rate, self.capacity = self._db.execute(
+                'SELECT rate, capacity FROM buckets WHERE name = ?', (name,)
+            ).fetchone()
+
+    def _update(self, change):
+        # Runs change(tokens) -> (tokens, result) on the refilled bucket in one transaction
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                tokens, updated, rate, capacity = self._db.execute(
+                    'SELECT tokens, updated, rate, capacity FROM buckets WHERE name = ?', (self.name,)
+                ).fetchone()
+                now = time.time()
+                self.rate, self.capacity = rate, capacity
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                tokens, result = change(tokens)
+                self._db.execute(
+                    'UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?', (tokens, now, self.name)
+                )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            return result
+
+    def delay(self, tokens: float = 1) -> float:
+        def change(available):
+            if available >= tokens:
+                return available, 0.0
+            return available, (tokens - available) / self.rate
+
+        return self._update(change)
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        def change(available):
+            if available >= tokens:
+                return available - tokens, True
+            return available, False
+
+        return self._update(change)
+
+    def release(self, tokens: float = 1) -> None:
+        self._update(lambda available: (min(self.capacity, available + tokens), None))
+
+    def acquire(self, tokens: float = 1) -> float:
+        started = time.monotonic()
+        while not self.try_acquire(tokens):
+            time.sleep(max(self.delay(tokens), 0.001))
+        return time.monotonic() - started
+
+    def set_rate(self, rate: float, capacity: float = None) -> None:
+        # Tokens earned at the old rate are stored first
+        self.delay()
+        with self._lock:
+            self._db.execute(
+                'UPDATE buckets SET rate = ?, capacity = COALESCE(?, capacity) WHERE name = ?',
+                (rate, capacity, self.name)
+            )
+            self.rate = rate
+            if capacity is not None:
+                self.capacity = capacity
+
+    def __getstate__(self):
+        # The connection is opened again in the process the bucket is sent to
+        state = self.__dict__.copy()
+        del state['_lock'], state['_db']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
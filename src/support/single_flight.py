@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    # Runs at most one call per key at a time. Concurrent callers with the same key wait for
+    # the call in flight and share its result, even when they run in different threads or event loops.
+    # With `copy` (e.g. copy.deepcopy) every waiter gets its own copy of a mutable result.
+    def __init__(self, copy=None):
+        self.copy = copy
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _shared(self, result):
+        return self.copy(result) if self.copy else result
+
+    def _join(self, key) -> tuple:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _done(self, key, future: Future, result=None, exception: BaseException = None) -> None:
+        with self._lock:
+            del self._calls[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    async def do(self, key, fn, *args, **kwargs):
+        future, owner = self._join(key)
+        if not owner:
+            return self._shared(await asyncio.wrap_future(future))
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._done(key, future, exception=e)
+            raise
+        self._done(key, future, result)
+        return result
+
+    def call(self, key, fn, *args, **kwargs):
+        future, owner = self._join(key)
+        if not owner:
+            return self._shared(future.result())
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._done(key, future, exception=e)
+            raise
+        self._done(key, future, result)
+        return result
+
+    def __getstate__(self):
+        # Calls in flight belong to the sending process, a copy starts empty
+        return {'copy': self.copy}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class Memo:
+    # Small thread-safe memo of recent results. Entries expire after ttl seconds,
+    # the oldest ones are dropped when there are more than size of them.
+    # With `copy`, entries are copied when stored and when read, so callers cannot change them
+    MISS = object()
+
+    def __init__(self, ttl: float = 300, size: int = 1024, copy=None):
+        self.ttl = ttl
+        self.size = size
+        self.copy = copy
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self.MISS
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return self.MISS
+            value = entry[1]
+        return self.copy(value) if self.copy else value
+
+    def set(self, key, value) -> None:
+        if self.ttl <= 0:
+            return
+        if self.copy:
+            value = self.copy(value)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic(), value)
+            while len(self._entries) > self.size:
+                del self._entries[next(iter(self._entries))]
@@ -9,7 +9,10 @@ class Stats:
         self.projects = {}
         self.attachments = {
             "testrail": 0,
-            "qase": 0
+            "qase": 0,
+            "deduplicated": 0,
+            "cached": 0,
+            "referenced": 0
         }
         self.users = {
             "testrail": 0,
@@ -19,6 +22,12 @@ class Stats:
             "testrail": 0,
             "qase": 0
         }
+        # Attachment transfers per scheduling lane (small and large files)
+        self.lanes = {}
+        # Requests and opened connections per HTTP client
+        self.http = {}
+        # Rate and time tasks waited for a token per throttled pool
+        self.pools = {}
 
     def add_project(self, code: str, title: str):
         self.projects[code] = {
@@ -47,6 +56,46 @@ class Stats:
     def add_attachment(self, type: str, count: int = 1):
         self.attachments[type] += count
 
+    def add_lane_transfer(self, lane: str, size: int, seconds: float):
+        if lane not in self.lanes:
+            self.lanes[lane] = {
+                "attachments": 0,
+                "bytes": 0,
+                "seconds": 0.0,
+                "bytes_per_second": 0,
+            }
+        stats = self.lanes[lane]
+        stats["attachments"] += 1
+        stats["bytes"] += size
+        stats["seconds"] += seconds
+        if stats["seconds"] > 0:
+            stats["bytes_per_second"] = int(stats["bytes"] / stats["seconds"])
+
+    def add_http(self, client: str, stats: dict):
+        self.http[client] = stats
+
+    def add_pool(self, pool: str, stats: dict):
+        self.pools[pool] = stats
+
+    # Adds the counters of another Stats, e.g. the one a worker process collected for a project
+    def merge(self, other: 'Stats') -> None:
+        for name, value in vars(other).items():
+            setattr(self, name, self._merge(getattr(self, name, None), value))
+        for stats in self.lanes.values():
+            if stats["seconds"] > 0:
+                stats["bytes_per_second"] = int(stats["bytes"] / stats["seconds"])
+
+    @classmethod
+    def _merge(cls, target, value):
+        if isinstance(value, dict):
+            target = target if isinstance(target, dict) else {}
+            for key, item in value.items():
+                target[key] = cls._merge(target[key], item) if key in target else item
+            return target
+        if isinstance(value, (int, float)) and isinstance(target, (int, float)):
+            return target + value
+        return value
+
     def add_custom_field(self, type: str, count: int = 1):
         self.custom_fields[type] += count
 
@@ -0,0 +1,83 @@
+import hashlib
+import uuid
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+
+class AttachmentFile:
+    # File-like holder for a downloaded attachment. Content stays in memory up to spool_size bytes,
+    # anything bigger is transparently moved to a temporary file on disk.
+    def __init__(self, name: str = 'attachment', mime: str = '', spool_size: int = 8 * 1024 * 1024):
+        self.name = name
+        self.mime = mime
+        self.size = 0
+        self.file = SpooledTemporaryFile(max_size=spool_size)
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def digest(self) -> str:
+        return self._sha256.hexdigest()
+
+    def write(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def rewind(self) -> None:
+        self.file.seek(0)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class MultipartStream:
+    # multipart/form-data request body that reads file parts lazily, chunk by chunk
+    def __init__(self, field: str, files: list):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self._parts = []
+        self._index = 0
+        self._length = 0
+
+        for file in files:
+            filename = self.filename(file.name)
+            header = (
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: {file.mime or "application/octet-stream"}\r\n\r\n'
+            ).encode('utf-8')
+            file.rewind()
+            self._add(BytesIO(header), len(header))
+            self._add(file, file.size)
+            self._add(BytesIO(b'\r\n'), 2)
+
+        footer = f'--{self.boundary}--\r\n'.encode('utf-8')
+        self._add(BytesIO(footer), len(footer))
+
+    @staticmethod
+    def filename(name: str) -> str:
+        # File name as sent in the Content-Disposition header
+        return name.replace('"', '%22').replace('\r', '').replace('\n', '')
+
+    def _add(self, part, size: int) -> None:
+        self._parts.append(part)
+        self._length += size
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._index < len(self._parts):
+            chunk = self._parts[self._index].read(size)
+            if not chunk:
+                self._index += 1
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
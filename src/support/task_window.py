@@ -0,0 +1,30 @@
+import asyncio
+
+
+class TaskWindow:
+    # TaskGroup that runs at most `size` tasks at a time. spawn() waits for a free slot before the task is
+    # created, so the loop feeding the window pauses while it is full and memory grows with the window,
+    # not with the total amount of work. Errors behave as in TaskGroup: the first failure cancels the rest.
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._slots = None
+        self._group = asyncio.TaskGroup()
+
+    async def __aenter__(self):
+        self._slots = asyncio.Semaphore(self.size)
+        await self._group.__aenter__()
+        return self
+
+    async def __aexit__(self, et, exc, tb):
+        return await self._group.__aexit__(et, exc, tb)
+
+    async def spawn(self, coro) -> asyncio.Task:
+        try:
+            await self._slots.acquire()
+            task = self._group.create_task(coro)
+        except BaseException:
+            # Cancelled while waiting or the group is shutting down, the coroutine will never run
+            coro.close()
+            raise
+        task.add_done_callback(lambda _: self._slots.release())
+        return task
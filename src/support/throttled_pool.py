@@ -1,47 +1,234 @@
-import math
+import os
 import time
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import threading
 
+from .token_bucket import TokenBucket
+from .operations import PRIORITIES, NORMAL
+
 
 class ThrottledThreadPoolExecutor(ThreadPoolExecutor):
-    def __init__(self, max_workers=None, requests=100, interval=1, refill_factor=1):
-        super().__init__(max_workers)
+    # Thread pool limited to `requests` tasks per `interval` seconds. Submitted tasks wait in a queue,
+    # not in worker threads: a dispatcher hands a task to a worker once both a worker and a token are free.
+    # Tokens are refilled continuously, so tasks start at a steady rate instead of in bursts.
+    # Queued tasks start by priority (HIGH first), but at least `low_share` of the starts go to the lowest
+    # priority waiting, so it is never starved.
+    # Tasks may belong to a named budget with its own bucket (`budgets`, name -> TokenBucket). They need a token
+    # of their budget and of the pool. A budget that is used up does not hold back tasks of other budgets.
+    # `bucket` replaces the pool's own bucket, e.g. with a SqliteTokenBucket shared with other processes.
+    # Tasks waiting to retry a call give their worker slot to other tasks (see wait_retry), up to `spare` of them
+    # at a time. They keep their thread, so the pool has `spare` threads on top of `max_workers`.
+    def __init__(self, max_workers=None, requests=100, interval=1, burst=None, low_share=0.1, budgets=None, bucket=None,
+                 spare=None):
+        self.workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        spare = self.workers if spare is None else spare
+        super().__init__(self.workers + spare)
         self.interval = interval
-        self.refill_factor = refill_factor
         self.rate = requests / interval
         self.capacity = requests
-        self.tokens = self.capacity
-        self.last_refill_time = time.monotonic()
-        self._lock = threading.Lock()
-        self._wait_event = threading.Event()
-
-    def _try_refill_tokens(self):
-        now = time.monotonic()
-        with self._lock:
-            elapsed = now - self.last_refill_time
-            if elapsed >= self.interval / self.refill_factor:
-                refill_amount = elapsed * self.rate
-                if refill_amount >= 1:
-                    self.tokens = min(self.capacity, math.floor(self.tokens + refill_amount))
-                    self.last_refill_time = now
-                    return True
-        return False
+        self.bucket = bucket if bucket is not None else TokenBucket(self.rate, burst)
+        self.budgets = budgets or {}
+
+        # priority -> budget -> tasks
+        self._queues = {priority: {} for priority in PRIORITIES}
+        self._stride = max(1, round(1 / low_share)) if low_share > 0 else 0
+        self._started = 0
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(self.workers)
+        self._spare = threading.Semaphore(spare)
+        # Tasks that came back from waiting when no slot was free, see _idle
+        self._borrowed = 0
+        self._local = threading.local()
+        self._closed = False
+
+        self.waits = {
+            'tasks': 0,
+            'seconds': 0.0,
+            'max': 0.0,
+        }
+        self.usage = {}
+        self._stats_lock = threading.Lock()
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name='throttled-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    # Blocks until a token is available. Also used by callers that run throttled work outside of the pool
+    def acquire(self, budget=None):
+        waited = 0.0
+        if budget in self.budgets:
+            waited += self.budgets[budget].acquire()
+        waited += self.bucket.acquire()
+        self._record_wait(waited, budget)
+
+    def sleep(self, seconds: float) -> None:
+        self._idle(time.sleep, seconds)
+
+    # Called by a task before it retries a call. A retry is a new request, so after the delay it takes
+    # a token of the pool and of the budget like a new task
+    def wait_retry(self, seconds: float, budget=None) -> None:
+        def wait():
+            time.sleep(seconds)
+            self.acquire(budget)
+
+        self._idle(wait)
+
+    def _idle(self, fn, *args):
+        # A task of this pool gives its slot to queued tasks while it waits, if a spare thread is left for it.
+        # Called from any other thread, fn just runs
+        if not getattr(self._local, 'task', False) or not self._spare.acquire(blocking=False):
+            return fn(*args)
+        self._slots.release()
+        try:
+            return fn(*args)
+        finally:
+            # The dispatcher holds a slot while it waits for work, so the task does not wait for one. Without
+            # a free slot it goes on above max_workers, and the next task to end keeps its slot instead
+            if not self._slots.acquire(blocking=False):
+                with self._stats_lock:
+                    self._borrowed += 1
+            self._spare.release()
 
     def submit(self, fn, *args, **kwargs):
-        def exec_throttled():
-            while True:
-                with self._lock:
-                    if self.tokens > 0:
-                        self.tokens -= 1
-                        break  # Token is available, proceed to submit the task
-                # Attempt to refill tokens without holding the lock the entire time
-                if not self._try_refill_tokens():
-                    self._wait_event.wait(0.1)  # Wait briefly and then try again
-                    self._wait_event.clear()  # Clear the event to reset its state
-                else:
-                    self._wait_event.set()  # Signal that tokens may have been refilled
-
-            return fn(*args, **kwargs)
-
-        return super().submit(exec_throttled)
+        return self.schedule(fn, args, kwargs)
+
+    def schedule(self, fn, args=(), kwargs=None, priority=NORMAL, budget=None):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            queue = self._queues[priority].setdefault(budget, deque())
+            queue.append((future, fn, args, kwargs or {}, time.monotonic(), budget))
+            self._cond.notify()
+        return future
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            with self._cond:
+                task = self._next_task()
+            if task is None:
+                self._slots.release()
+                return
+            future, fn, args, kwargs, queued, budget = task
+            # Time spent waiting for a worker and a token, exposed on the future and in the stats
+            future.wait_time = time.monotonic() - queued
+            self._record_wait(future.wait_time, budget)
+            super().submit(self._run, future, fn, args, kwargs)
+
+    def _next_task(self):
+        # Called with self._cond held. Waits until a task is queued and tokens are available for it
+        while True:
+            delay = None
+            for queues in self._pick_order():
+                # Within a priority the oldest task goes first, skipping budgets without tokens
+                for queue in sorted((queue for queue in queues.values() if queue), key=lambda queue: queue[0][4]):
+                    budget = self.budgets.get(queue[0][5])
+                    wait = budget.delay() if budget else 0.0
+                    if wait <= 0:
+                        wait = self.bucket.delay()
+                    if wait > 0:
+                        delay = wait if delay is None else min(delay, wait)
+                        continue
+                    if not self.bucket.try_acquire():
+                        continue
+                    if budget and not budget.try_acquire():
+                        self.bucket.release()
+                        continue
+                    self._started += 1
+                    return queue.popleft()
+
+            if delay is None:
+                if not any(queue for queues in self._queues.values() for queue in queues.values()):
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                continue
+            # Sleeps until the next token is due. A new task only wakes it to be considered in the next pick
+            self._cond.wait(delay)
+
+    def _pick_order(self) -> list:
+        waiting = [queues for queues in self._queues.values() if any(queues.values())]
+        if self._stride and len(waiting) > 1 and (self._started + 1) % self._stride == 0:
+            return [waiting[-1]] + waiting[:-1]
+        return waiting
+
+    def _run(self, future: Future, fn, args, kwargs):
+        self._local.task = True
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        finally:
+            self._local.task = False
+            with self._stats_lock:
+                borrowed = self._borrowed > 0
+                if borrowed:
+                    self._borrowed -= 1
+            if not borrowed:
+                self._slots.release()
+
+    def _record_wait(self, seconds: float, budget=None):
+        with self._stats_lock:
+            self.waits['tasks'] += 1
+            self.waits['seconds'] += seconds
+            self.waits['max'] = max(self.waits['max'], seconds)
+            usage = self.usage.setdefault(budget or 'default', {'tasks': 0, 'seconds': 0.0})
+            usage['tasks'] += 1
+            usage['seconds'] += seconds
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            tasks = self.waits['tasks']
+            return {
+                'rate': round(self.bucket.rate, 2),
+                'tasks': tasks,
+                'avg_wait': round(self.waits['seconds'] / tasks, 3) if tasks else 0.0,
+                'max_wait': round(self.waits['max'], 3),
+                'budgets': {
+                    name: {
+                        'rate': round(self.budgets[name].rate, 2) if name in self.budgets else None,
+                        'tasks': usage['tasks'],
+                        'avg_wait': round(usage['seconds'] / usage['tasks'], 3),
+                    }
+                    for name, usage in self.usage.items()
+                },
+            }
+
+    @staticmethod
+    def merge_stats(stats: list) -> dict:
+        # Combines stats() of pools in several processes
+        tasks = sum(item['tasks'] for item in stats)
+        budgets = {}
+        for item in stats:
+            for name, usage in item['budgets'].items():
+                total = budgets.setdefault(name, {'rate': usage['rate'], 'tasks': 0, 'avg_wait': 0.0})
+                total['tasks'] += usage['tasks']
+                total['avg_wait'] += usage['avg_wait'] * usage['tasks']
+        for total in budgets.values():
+            total['avg_wait'] = round(total['avg_wait'] / total['tasks'], 3) if total['tasks'] else 0.0
+        return {
+            'rate': max(item['rate'] for item in stats),
+            'tasks': tasks,
+            'avg_wait': round(sum(item['avg_wait'] * item['tasks'] for item in stats) / tasks, 3) if tasks else 0.0,
+            'max_wait': max(item['max_wait'] for item in stats),
+            'budgets': budgets,
+        }
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._cond:
+            self._closed = True
+            if cancel_futures:
+                for queues in self._queues.values():
+                    for queue in queues.values():
+                        while queue:
+                            queue.popleft()[0].cancel()
+            self._cond.notify_all()
+        if wait:
+            self._dispatcher.join()
+        super().shutdown(wait, cancel_futures=cancel_futures)
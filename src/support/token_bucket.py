@@ -0,0 +1,61 @@
+import threading
+import time
+
+
+class TokenBucket:
+    # Token bucket refilled continuously at `rate` tokens per second, holding at most `capacity` tokens.
+    # Waiters sleep exactly until the next token is due instead of polling.
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, tokens: float = 1) -> float:
+        # Seconds until `tokens` tokens are available, 0 if they are available now
+        with self._cond:
+            self._refill()
+            if self.tokens >= tokens:
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._cond:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def release(self, tokens: float = 1) -> None:
+        # Gives back tokens taken but not used
+        with self._cond:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+            self._cond.notify_all()
+
+    def acquire(self, tokens: float = 1) -> float:
+        # Blocks until the tokens are taken. Returns the time spent waiting
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return time.monotonic() - started
+                self._cond.wait((tokens - self.tokens) / self.rate)
+
+    def set_rate(self, rate: float, capacity: float = None) -> None:
+        with self._cond:
+            self._refill()
+            self.rate = rate
+            if capacity is not None:
+                self.capacity = capacity
+                self.tokens = min(self.tokens, capacity)
+            # Waiters recompute their deadline with the new rate
+            self._cond.notify_all()
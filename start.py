@@ -2,21 +2,23 @@ from src import TestRailImporter, TestRailImporterSync
 from src.support.config_manager import ConfigManager
 from src.support.logger import Logger
 
-config = ConfigManager()
-try:
-    config.load_config()
-except Exception as e:
-    config.build_config()
+# Worker processes of projects.processes import this module again, the migration starts only in the main one
+if __name__ == '__main__':
+    config = ConfigManager()
+    try:
+        config.load_config()
+    except Exception as e:
+        config.build_config()
 
-prefix = config.get('prefix')
-if prefix == None:
-    prefix = ''
+    prefix = config.get('prefix')
+    if prefix == None:
+        prefix = ''
 
-logger = Logger(config.get('debug'), prefix=prefix)
+    logger = Logger(config.get('debug'), prefix=prefix)
 
-if config.get('sync'):
-    importer = TestRailImporterSync(config, logger)
-else:
-    importer = TestRailImporter(config, logger)
+    if config.get('sync'):
+        importer = TestRailImporterSync(config, logger)
+    else:
+        importer = TestRailImporter(config, logger)
 
-importer.start()
+    importer.start()
@@ -0,0 +1,61 @@
+from unittest import mock
+
+import pytest
+
+from src.api import testrail
+from src.support import RetryPolicy
+
+
+class Response:
+    def __init__(self, ids=None, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self.ids = ids
+
+    def json(self):
+        if self.ids is None:
+            raise ValueError('not JSON')
+        return {'data': [{'id': str(i), 'project_id': [1]} for i in self.ids]}
+
+
+def client(pages: dict, failures: dict) -> testrail.TestrailApiClient:
+    # pages: offset -> number of attachments, failures: offset -> responses that fail before the page
+    def post(url, data, headers):
+        offset = data['offset']
+        if failures.get(offset):
+            failures[offset] -= 1
+            return Response(status_code=502) if failures[offset] % 2 else Response()
+        return Response(range(offset, offset + pages.get(offset, 0)))
+
+    client = testrail.TestrailApiClient.__new__(testrail.TestrailApiClient)
+    client.session = mock.Mock(post=post)
+    client.logger = mock.Mock()
+    client.base_url = 'https://testrail/'
+    client.csrf_token = 'token'
+    client.max_retries = 3
+    client.retry = RetryPolicy(max_retries=3, base=0.001, cap=0.001, threshold=100)
+    client.breaker = client.retry.breaker('testrail-attachments-list')
+    client.attachments_page_size = 10
+    client.attachments_workers = 4
+    return client
+
+
+def test_lists_until_a_short_page():
+    pages = {offset: 10 for offset in range(0, 70, 10)}
+    pages[70] = 3
+
+    assert len(client(pages, {}).get_attachments_list()) == 73
+
+
+def test_failed_page_is_retried():
+    pages = {offset: 10 for offset in range(0, 70, 10)}
+    pages[70] = 3
+
+    assert len(client(pages, {30: 2, 50: 3}).get_attachments_list()) == 73
+
+
+def test_page_failing_after_retries_fails_the_listing():
+    pages = {offset: 10 for offset in range(0, 70, 10)}
+
+    with pytest.raises(testrail.APIError):
+        client(pages, {30: 10}).get_attachments_list()
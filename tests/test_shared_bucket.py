@@ -0,0 +1,78 @@
+import multiprocessing
+import pickle
+import time
+
+from src.support.shared_bucket import SqliteTokenBucket
+
+
+def take(path, count):
+    bucket = SqliteTokenBucket(path, 'qase', 20)
+    for _ in range(count):
+        bucket.acquire()
+    return time.time()
+
+
+def test_takes_and_refills(tmp_path):
+    bucket = SqliteTokenBucket(str(tmp_path / 'rate.sqlite'), 'qase', rate=10, capacity=2)
+
+    assert bucket.try_acquire(2)
+    assert not bucket.try_acquire()
+    assert 0.05 < bucket.delay() <= 0.1
+    bucket.release()
+    assert bucket.try_acquire()
+
+
+def test_buckets_with_one_file_share_tokens(tmp_path):
+    path = str(tmp_path / 'rate.sqlite')
+    first = SqliteTokenBucket(path, 'qase', rate=1, capacity=2)
+    second = SqliteTokenBucket(path, 'qase', rate=1, capacity=2)
+    other = SqliteTokenBucket(path, 'other', rate=1, capacity=2)
+
+    assert first.try_acquire(2)
+    assert not second.try_acquire()
+    assert other.try_acquire(2)
+
+
+def test_existing_bucket_keeps_its_rate(tmp_path):
+    path = str(tmp_path / 'rate.sqlite')
+    SqliteTokenBucket(path, 'qase', rate=20).set_rate(5)
+
+    assert SqliteTokenBucket(path, 'qase', rate=20).rate == 5
+    assert SqliteTokenBucket(path, 'qase', rate=20, reset=True).rate == 20
+
+
+def test_set_rate_is_seen_by_other_buckets(tmp_path):
+    path = str(tmp_path / 'rate.sqlite')
+    first = SqliteTokenBucket(path, 'qase', rate=20)
+    second = SqliteTokenBucket(path, 'qase', rate=20)
+    first.set_rate(4)
+    second.delay()
+
+    assert second.rate == 4
+
+
+def test_pickled_bucket_reopens_the_file(tmp_path):
+    bucket = SqliteTokenBucket(str(tmp_path / 'rate.sqlite'), 'qase', rate=1, capacity=1)
+    copy = pickle.loads(pickle.dumps(bucket))
+
+    assert copy.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_processes_share_the_rate(tmp_path):
+    path = str(tmp_path / 'rate.sqlite')
+    SqliteTokenBucket(path, 'qase', 20)
+    started = time.time()
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        ended = max(pool.starmap(take, [(path, 20)] * 3))
+
+    # 60 tokens at 20 per second, 20 of them available at once
+    assert ended - started > 1.8
+
+
+def test_kept_rate_is_lowered_to_max_rate(tmp_path):
+    path = str(tmp_path / 'rate.sqlite')
+    SqliteTokenBucket(path, 'qase', rate=20).set_rate(80)
+
+    assert SqliteTokenBucket(path, 'qase', rate=20, max_rate=40).rate == 40
+    assert SqliteTokenBucket(path, 'qase', rate=20, max_rate=60).rate == 40
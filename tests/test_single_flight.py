@@ -0,0 +1,109 @@
+import asyncio
+import copy
+import pickle
+import threading
+import time
+
+import pytest
+
+from src.support.single_flight import SingleFlight, Memo
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.call('key', fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['result'] * 5
+
+
+def test_waiters_get_the_error():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.1)
+        raise ValueError('failed')
+
+    async def main():
+        return await asyncio.gather(flight.do('key', fail), flight.do('key', fail), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_next_call_runs_again():
+    flight = SingleFlight()
+    calls = []
+
+    assert flight.call('key', lambda: calls.append(1) or len(calls)) == 1
+    assert flight.call('key', lambda: calls.append(1) or len(calls)) == 2
+
+
+def test_waiters_get_copies():
+    flight = SingleFlight(copy=copy.deepcopy)
+
+    async def fetch():
+        await asyncio.sleep(0.1)
+        return [1]
+
+    async def main():
+        return await asyncio.gather(*(flight.do('key', fetch) for _ in range(3)))
+
+    results = asyncio.run(main())
+    results[0].append(2)
+    assert results[1:] == [[1], [1]]
+
+
+def test_pickled_flight_starts_empty():
+    flight = pickle.loads(pickle.dumps(SingleFlight(copy=copy.deepcopy)))
+
+    assert flight.copy is copy.deepcopy
+    assert flight.call('key', lambda: 5) == 5
+
+
+def test_memo_expires():
+    memo = Memo(ttl=0.1)
+    memo.set('key', 1)
+
+    assert memo.get('key') == 1
+    time.sleep(0.15)
+    assert memo.get('key') is Memo.MISS
+
+
+def test_memo_drops_oldest():
+    memo = Memo(size=2)
+    for key in 'abc':
+        memo.set(key, key)
+
+    assert memo.get('a') is Memo.MISS
+    assert memo.get('c') == 'c'
+
+
+def test_memo_disabled_with_zero_ttl():
+    memo = Memo(ttl=0)
+    memo.set('key', 1)
+
+    assert memo.get('key') is Memo.MISS
+
+
+@pytest.mark.parametrize('change', [lambda value: value.append(2), lambda value: value.clear()])
+def test_memo_copies_entries(change):
+    memo = Memo(copy=copy.deepcopy)
+    value = [1]
+    memo.set('key', value)
+    change(value)
+    change(memo.get('key'))
+
+    assert memo.get('key') == [1]
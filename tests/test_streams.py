@@ -0,0 +1,71 @@
+import hashlib
+import email.parser
+import email.policy
+
+from src.support.streams import AttachmentFile, MultipartStream
+
+
+def attachment(name, content, mime='', spool_size=1024):
+    file = AttachmentFile(name, mime, spool_size=spool_size)
+    for i in range(0, len(content), 100):
+        file.write(content[i:i + 100])
+    return file
+
+
+def parse(stream: MultipartStream, body: bytes) -> list:
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {stream.content_type}\r\n\r\n'.encode() + body
+    )
+    return [(part.get_param('name', header='content-disposition'), part.get_filename(),
+             part.get_content_type(), part.get_payload(decode=True)) for part in message.iter_parts()]
+
+
+def test_attachment_file_spools_to_disk_and_hashes():
+    content = b'x' * 5000
+    file = attachment('big.bin', content, spool_size=1024)
+
+    assert file.size == 5000
+    assert file.digest == hashlib.sha256(content).hexdigest()
+    assert file.file._rolled
+    file.rewind()
+    assert file.read() == content
+
+
+def test_body_is_valid_multipart():
+    files = [attachment('a.png', b'\x89PNG' + bytes(range(256)) * 10, 'image/png'), attachment('b.txt', b'hello')]
+    stream = MultipartStream('file', files)
+    body = stream.read()
+
+    assert len(body) == len(stream)
+    assert parse(stream, body) == [
+        ('file', 'a.png', 'image/png', b'\x89PNG' + bytes(range(256)) * 10),
+        ('file', 'b.txt', 'application/octet-stream', b'hello'),
+    ]
+
+
+def test_reads_in_chunks():
+    files = [attachment('a.bin', b'a' * 3000), attachment('b.bin', b'b' * 10)]
+    stream = MultipartStream('file', files)
+    chunks = []
+    while chunk := stream.read(64):
+        assert len(chunk) <= 64
+        chunks.append(chunk)
+
+    assert len(b''.join(chunks)) == len(stream)
+    assert [part[3] for part in parse(stream, b''.join(chunks))] == [b'a' * 3000, b'b' * 10]
+
+
+def test_filename_is_escaped():
+    stream = MultipartStream('file', [attachment('bad"\r\nname.txt', b'1')])
+
+    assert b'filename="bad%22name.txt"' in stream.read()
+
+
+def test_stream_can_be_rebuilt_for_a_retry():
+    files = [attachment('a.txt', b'content')]
+    first = MultipartStream('file', files)
+    first_parts = parse(first, first.read())
+    # Building the stream again rewinds the files, a retry sends the same content
+    second = MultipartStream('file', files)
+
+    assert parse(second, second.read()) == first_parts == [('file', 'a.txt', 'application/octet-stream', b'content')]
@@ -0,0 +1,69 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.support.pools import Pools
+from src.support.task_window import TaskWindow
+
+
+def test_runs_at_most_size_tasks():
+    running = 0
+    peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def main():
+        async with TaskWindow(3) as window:
+            for _ in range(20):
+                await window.spawn(job())
+
+    asyncio.run(main())
+    assert peak == 3
+
+
+def test_spawn_waits_for_a_slot():
+    spawned = []
+
+    async def main():
+        async with TaskWindow(2) as window:
+            for i in range(4):
+                await window.spawn(asyncio.sleep(0.1))
+                spawned.append(asyncio.get_running_loop().time())
+
+    asyncio.run(main())
+    # The third spawn waits until one of the first two tasks ends
+    assert spawned[2] - spawned[0] >= 0.09
+
+
+def test_failure_cancels_the_rest():
+    finished = []
+
+    async def job(i):
+        await asyncio.sleep(0.05 if i else 0.01)
+        if i == 0:
+            raise ValueError('failed')
+        finished.append(i)
+
+    async def main():
+        async with TaskWindow(5) as window:
+            for i in range(100):
+                await window.spawn(job(i))
+
+    with pytest.raises(ExceptionGroup) as error:
+        asyncio.run(main())
+    assert error.group_contains(ValueError)
+    assert not finished
+
+
+def test_window_sized_from_pool_workers():
+    pools = Pools(qase_pool=ThreadPoolExecutor(max_workers=3), tr_pool=ThreadPoolExecutor(max_workers=5), window=2)
+
+    assert pools.tr_window().size == 10
+    assert pools.qs_window().size == 6
+    assert pools.window().size == 16
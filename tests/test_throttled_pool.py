@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from src.support.operations import HIGH, LOW
+from src.support.throttled_pool import ThrottledThreadPoolExecutor
+from src.support.token_bucket import TokenBucket
+
+
+def record(starts):
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            starts.append(time.monotonic())
+
+    return task
+
+
+def test_steady_rate():
+    pool = ThrottledThreadPoolExecutor(max_workers=4, requests=20, interval=1, burst=1)
+    starts = []
+    task = record(starts)
+    for future in [pool.submit(task) for _ in range(11)]:
+        future.result()
+    pool.shutdown()
+
+    # 10 gaps of 1/20 s each, no task starts before its token is due
+    assert max(starts) - min(starts) == pytest.approx(0.5, abs=0.15)
+
+
+def test_burst_starts_at_once():
+    pool = ThrottledThreadPoolExecutor(max_workers=5, requests=1, interval=1, burst=5)
+    starts = []
+    task = record(starts)
+    for future in [pool.submit(task) for _ in range(5)]:
+        future.result()
+    pool.shutdown()
+
+    assert max(starts) - min(starts) < 0.1
+
+
+def test_wait_time_is_recorded():
+    pool = ThrottledThreadPoolExecutor(max_workers=2, requests=10, interval=1, burst=1)
+    futures = [pool.submit(lambda: None) for _ in range(3)]
+    for future in futures:
+        future.result()
+    pool.shutdown()
+
+    assert all(future.wait_time >= 0 for future in futures)
+    assert futures[-1].wait_time > 0.1
+    stats = pool.stats()
+    assert stats['tasks'] == 3
+    assert stats['max_wait'] >= futures[-1].wait_time - 0.01
+
+
+def test_high_priority_first_and_low_not_starved():
+    pool = ThrottledThreadPoolExecutor(max_workers=1, requests=1000, interval=1, low_share=0.25)
+    order = []
+    gate = threading.Event()
+    pool.submit(gate.wait)
+    futures = [pool.schedule(order.append, ('low',), priority=LOW) for _ in range(4)]
+    futures += [pool.schedule(order.append, ('high',), priority=HIGH) for _ in range(6)]
+    gate.set()
+    for future in futures:
+        future.result()
+    pool.shutdown()
+
+    assert order[0] == 'high'
+    assert 'low' in order[:4]
+
+
+def test_used_up_budget_does_not_hold_back_others():
+    budgets = {'slow': TokenBucket(rate=1, capacity=1)}
+    pool = ThrottledThreadPoolExecutor(max_workers=2, requests=1000, interval=1, budgets=budgets)
+    slow = [pool.schedule(lambda: time.monotonic(), budget='slow') for _ in range(2)]
+    started = time.monotonic()
+    fast = [pool.schedule(lambda: time.monotonic()) for _ in range(5)]
+
+    assert all(future.result() - started < 0.3 for future in fast)
+    assert slow[1].result() - slow[0].result() > 0.8
+    pool.shutdown()
+
+
+def test_shutdown_runs_queued_tasks():
+    pool = ThrottledThreadPoolExecutor(max_workers=1, requests=50, interval=1, burst=1)
+    futures = [pool.submit(lambda i=i: i) for i in range(5)]
+    pool.shutdown(wait=True)
+
+    assert [future.result() for future in futures] == list(range(5))
+    with pytest.raises(RuntimeError):
+        pool.submit(lambda: None)
+
+
+def test_shutdown_cancels_queued_tasks():
+    pool = ThrottledThreadPoolExecutor(max_workers=1, requests=1, interval=10, burst=1)
+    running = threading.Event()
+    futures = [pool.submit(running.set)] + [pool.submit(lambda: None) for _ in range(2)]
+    running.wait(timeout=1)
+    started = time.monotonic()
+    pool.shutdown(wait=True, cancel_futures=True)
+
+    # Tasks waiting for a token are cancelled instead of holding up the shutdown
+    assert time.monotonic() - started < 1
+    assert futures[0].result() is None
+    assert all(future.cancelled() for future in futures[1:])
+
+
+def test_waiting_retry_frees_the_slot_and_takes_a_token():
+    pool = ThrottledThreadPoolExecutor(max_workers=1, requests=1000, interval=1)
+    retried = threading.Event()
+
+    def retry():
+        pool.wait_retry(0.3)
+        retried.set()
+
+    first = pool.submit(retry)
+    started = time.monotonic()
+    # Runs while the first task waits to retry, on the one worker slot
+    assert pool.submit(time.monotonic).result() - started < 0.2
+    first.result()
+    pool.shutdown()
+
+    assert retried.is_set()
+    assert pool.stats()['tasks'] == 3
@@ -0,0 +1,50 @@
+import threading
+import time
+
+from src.support.token_bucket import TokenBucket
+
+
+def test_starts_full_and_takes_tokens():
+    bucket = TokenBucket(rate=10, capacity=3)
+
+    assert bucket.try_acquire()
+    assert bucket.try_acquire(2)
+    assert not bucket.try_acquire()
+
+
+def test_delay_until_next_token():
+    bucket = TokenBucket(rate=10, capacity=1)
+    bucket.try_acquire()
+
+    assert 0.05 < bucket.delay() <= 0.1
+
+
+def test_release_gives_tokens_back_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.try_acquire(2)
+    bucket.release(5)
+
+    assert bucket.tokens == 2
+
+
+def test_acquire_waits_at_the_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    started = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+
+    assert 0.18 < time.monotonic() - started < 0.5
+
+
+def test_set_rate_wakes_waiters():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    bucket.try_acquire()
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(bucket.acquire()))
+    thread.start()
+    time.sleep(0.05)
+    bucket.set_rate(100)
+    thread.join(timeout=2)
+
+    assert not thread.is_alive()
+    assert waited[0] < 1